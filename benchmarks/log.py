@@ -0,0 +1,98 @@
+"""Time spent by the caller writing access records to a slow stdout.
+
+    python -m benchmarks.log [--number 20000] [--drain-kb 64]
+
+Access records are formatted as in the service and written to a pipe
+whose reader drains ``--drain-kb`` every millisecond, like a container
+runtime under pressure. Records are written directly by a
+`StreamHandler`, as before, and through the logging queue.
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+import typing as tp
+
+import numpy as np
+
+from service.log import QueuedLogging, access_logger, get_config
+from service.settings import get_config as get_service_config
+
+
+def drain(fd: int, chunk: int, stop: threading.Event) -> None:
+    while not stop.is_set():
+        if not os.read(fd, chunk):
+            return
+        time.sleep(0.001)
+
+
+def stream_handler(stream: tp.TextIO) -> logging.Handler:
+    access = get_config(get_service_config())["formatters"]["access"]
+    # the service name filter is not needed to time the writes
+    fmt = access["format"].replace('service_name="%(service_name)s" ', "")
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(fmt, access["datefmt"]))
+    return handler
+
+
+def per_record(number: int) -> np.ndarray:
+    times = np.empty(number)
+    extra = {
+        "request_time": 0.0012,
+        "status_code": 200,
+        "requested_url": "http://bench/reco/knn_model/123456",
+        "method": "GET",
+    }
+    for i in range(number):
+        start = time.perf_counter()
+        access_logger.info("", extra=extra)
+        times[i] = time.perf_counter() - start
+    return times
+
+
+def run(number: int, drain_kb: int, queued: bool) -> None:
+    read_fd, write_fd = os.pipe()
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=drain, args=(read_fd, drain_kb * 1024, stop), daemon=True
+    )
+    reader.start()
+    stream = os.fdopen(write_fd, "w")
+    access_logger.handlers.clear()
+    access_logger.addHandler(stream_handler(stream))
+    access_logger.setLevel(logging.INFO)
+    access_logger.propagate = False
+
+    queue = None
+    if queued:
+        queue = QueuedLogging([access_logger], size=10_000)
+        queue.start()
+    times = per_record(number)
+    dropped = queue.dropped if queue is not None else 0
+    if queue is not None:
+        queue.stop()
+    stop.set()
+    stream.close()
+    reader.join()
+    os.close(read_fd)
+
+    name = "queued" if queued else "direct"
+    print(
+        f"{name:<8} mean {times.mean() * 1e6:8.1f}us  "
+        f"p99 {np.quantile(times, 0.99) * 1e6:8.1f}us  "
+        f"max {times.max() * 1e3:7.2f}ms  dropped {dropped}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=20_000)
+    parser.add_argument("--drain-kb", type=int, default=64)
+    args = parser.parse_args()
+    for queued in (False, True):
+        run(args.number, args.drain_kb, queued)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cost of the stage timers of `KNNModel` with metrics on and off.
+
+    python -m benchmarks.metrics [--number 200000]
+
+Times the four stages of a prediction the way `KNNModel.predict` does,
+around empty stages, with no timer and with a `StageTimer`, then a
+whole `KNNModel.predict` on a small synthetic model both ways.
+"""
+import argparse
+import time
+import typing as tp
+
+from implicit.nearest_neighbours import CosineRecommender
+
+from benchmarks.neighbours import synthetic_interactions
+from service.api.models.knn_model import KNNModel
+from service.metrics import StageTimer
+from userknn import UserKnn
+
+
+def timed_stages(timer: tp.Optional[StageTimer]) -> None:
+    start = time.perf_counter() if timer else 0.0
+    if timer:
+        start = timer.lap("segment_lookup", start)
+    if timer:
+        start = timer.lap("similar_items", start)
+    if timer:
+        start = timer.lap("scoring", start)
+    if timer:
+        timer.lap("popular_backfill", start)
+
+
+def untimed_stages(timer: tp.Optional[StageTimer]) -> None:
+    pass
+
+
+def per_call(func: tp.Callable[[], tp.Any], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=200_000)
+    args = parser.parse_args()
+
+    timer = StageTimer("bench")
+    base = per_call(lambda: untimed_stages(None), args.number)
+    off = per_call(lambda: timed_stages(None), args.number) - base
+    on = per_call(lambda: timed_stages(timer), args.number) - base
+    print(
+        f"4 stages     disabled {off * 1e9:8.0f}ns  "
+        f"enabled {on * 1e9:8.0f}ns"
+    )
+
+    interactions = synthetic_interactions(5_000, 2_000)
+    knn = UserKnn(CosineRecommender(K=50), N_users=50)
+    knn.fit(interactions)
+    users = interactions["user_id"].unique()
+    model = KNNModel(
+        user_segment_map={user_id: 0 for user_id in users},
+        segment_model_map={0: knn},
+        pop_items=interactions["item_id"].value_counts().index.tolist(),
+    )
+    number = args.number // 100
+    user_ids = [int(users[i % len(users)]) for i in range(number)]
+
+    def predict_all() -> None:
+        for user_id in user_ids:
+            model.predict(user_id, 10)
+
+    times = {}
+    for name, stages in (("disabled", None), ("enabled", StageTimer("knn"))):
+        model.timer = stages
+        predict_all()
+        times[name] = per_call(predict_all, 3) / number
+    print(
+        f"predict      disabled {times['disabled'] * 1e6:8.1f}us  "
+        f"enabled {times['enabled'] * 1e6:8.1f}us"
+    )
+
+
+if __name__ == "__main__":
+    main()
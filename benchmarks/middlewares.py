@@ -0,0 +1,154 @@
+"""Per-request overhead of the access and exception middlewares.
+
+    python -m benchmarks.middlewares [--number 5000]
+
+Calls the app in process, without a server, with the pure ASGI
+middlewares it uses now and with the former `BaseHTTPMiddleware` ones,
+on /health and on `test_model`. Token checks are skipped and logging is
+disabled, so that the numbers are dominated by the middleware stack.
+"""
+import argparse
+import asyncio
+import logging
+import time
+import typing as tp
+
+from fastapi import FastAPI, Request
+from starlette.middleware import Middleware
+from starlette.middleware.base import (
+    BaseHTTPMiddleware,
+    RequestResponseEndpoint,
+)
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response
+
+from service.api.app import create_app
+from service.api.secure_token import verify_token
+from service.log import access_logger, app_logger
+from service.models import Error
+from service.response import server_error
+from service.settings import get_config
+
+
+class LegacyAccessMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self,
+        request: Request,
+        call_next: RequestResponseEndpoint,
+    ) -> Response:
+        started_at = time.perf_counter()
+        response = await call_next(request)
+        request_time = time.perf_counter() - started_at
+        access_logger.info(
+            msg="",
+            extra={
+                "request_time": round(request_time, 4),
+                "status_code": response.status_code,
+                "requested_url": request.url,
+                "method": request.method,
+            },
+        )
+        return response
+
+
+class LegacyExceptionHandlerMiddleware(BaseHTTPMiddleware):
+    async def dispatch(
+        self,
+        request: Request,
+        call_next: RequestResponseEndpoint,
+    ) -> Response:
+        try:
+            return await call_next(request)
+        except Exception as e:  # pylint: disable=W0703,W1203
+            app_logger.exception(
+                msg=f"Caught unhandled {e.__class__} exception: {e}"
+            )
+            error = Error(
+                error_key="server_error", error_message="Internal Server Error"
+            )
+            return server_error([error])
+
+
+def use_legacy_middlewares(app: FastAPI) -> FastAPI:
+    app.user_middleware = [
+        Middleware(
+            CORSMiddleware,
+            allow_origins=["*"],
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        ),
+        Middleware(LegacyAccessMiddleware),
+        Middleware(LegacyExceptionHandlerMiddleware),
+    ]
+    app.middleware_stack = app.build_middleware_stack()
+    return app
+
+
+async def per_request(app: FastAPI, path: str, number: int) -> float:
+    scope: tp.Dict[str, tp.Any] = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "server": ("bench", 80),
+        "client": ("127.0.0.1", 12345),
+    }
+
+    body = {"type": "http.request", "body": b"", "more_body": False}
+    disconnect = asyncio.Event()
+
+    async def send(message: tp.Dict[str, tp.Any]) -> None:
+        pass
+
+    start = time.perf_counter()
+    for _ in range(number):
+        messages = [body]
+
+        async def receive() -> tp.Dict[str, tp.Any]:
+            if messages:
+                return messages.pop()
+            # like a server, wait for the client to go away
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        await app(dict(scope), receive, send)
+    return (time.perf_counter() - start) / number
+
+
+def make_app(legacy: bool) -> FastAPI:
+    config = get_config()
+    config.models_config.enabled = ["test_model"]
+    app = create_app(config)
+    app.dependency_overrides[verify_token] = lambda: None
+    return use_legacy_middlewares(app) if legacy else app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=5_000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    loop = asyncio.new_event_loop()
+    apps = {"legacy": make_app(legacy=True), "asgi": make_app(legacy=False)}
+    for path in ("/health", "/reco/test_model/1"):
+        times = {
+            name: loop.run_until_complete(per_request(app, path, args.number))
+            for name, app in apps.items()
+        }
+        print(
+            f"{path:<20} legacy {times['legacy'] * 1e6:8.1f}us  "
+            f"asgi {times['asgi'] * 1e6:8.1f}us  "
+            f"saved {(times['legacy'] - times['asgi']) * 1e6:6.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Recall and latency of approximate neighbours against exact ones.
+
+    python -m benchmarks.neighbours [--interactions interactions.csv]
+
+Fits `UserKnn` with the exact implicit recommender and with `LSHIndex`
+in a few configurations, then looks up the neighbours of a sample of
+users with each of them. Recall is the share of the exact neighbours the
+approximate ones find. Without ``--interactions`` a synthetic dataset of
+users with clustered tastes is used.
+"""
+import argparse
+import time
+import typing as tp
+
+import numpy as np
+import pandas as pd
+from implicit.nearest_neighbours import CosineRecommender, TFIDFRecommender
+
+from service.api.models.knn_index import similar_users
+from service.api.models.lsh_index import LSHIndex
+from userknn import UserKnn
+
+EXACT_RECOMMENDERS = {"cosine": CosineRecommender, "tfidf": TFIDFRecommender}
+
+
+def synthetic_interactions(
+    n_users: int,
+    n_items: int,
+    n_clusters: int = 200,
+    seed: int = 0,
+) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(5, 40, size=n_users)
+    clusters = rng.integers(0, n_clusters, size=n_users)
+    # every cluster prefers its own slice of the catalogue
+    slice_size = max(n_items // n_clusters, 1)
+    users = np.repeat(np.arange(n_users), counts)
+    own = rng.random(len(users)) < 0.7
+    items = np.where(
+        own,
+        np.repeat(clusters, counts) * slice_size
+        + rng.integers(0, slice_size, size=len(users)),
+        rng.integers(0, n_items, size=len(users)),
+    )
+    return pd.DataFrame({"user_id": users, "item_id": items % n_items})
+
+
+def lookup(
+    model: UserKnn,
+    users: np.ndarray,
+) -> tp.Tuple[tp.List[np.ndarray], np.ndarray]:
+    found, latencies = [], []
+    for user in users:
+        start = time.perf_counter()
+        ids, _ = similar_users(model.user_knn, user, model.N_users, np.inf)
+        latencies.append(time.perf_counter() - start)
+        found.append(ids)
+    return found, np.array(latencies)
+
+
+def fit(model: UserKnn, interactions: pd.DataFrame) -> float:
+    # the whole fit, the neighbour table included
+    start = time.perf_counter()
+    model.fit(interactions)
+    return time.perf_counter() - start
+
+
+def report(
+    name: str,
+    fit_time: float,
+    latencies: np.ndarray,
+    recall: float,
+) -> None:
+    print(
+        f"{name:<16} fit {fit_time:8.2f}s  "
+        f"mean {latencies.mean() * 1e3:7.3f}ms  "
+        f"p95 {np.quantile(latencies, 0.95) * 1e3:7.3f}ms  "
+        f"recall {recall:.3f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--interactions", help="csv with user_id, item_id")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=5_000)
+    parser.add_argument("--n-users", type=int, default=50)
+    parser.add_argument("--sample", type=int, default=1_000)
+    parser.add_argument(
+        "--weighting", choices=sorted(EXACT_RECOMMENDERS), default="cosine"
+    )
+    parser.add_argument(
+        "--configs",
+        default="8x12,16x8,32x6,32x4",
+        help="comma separated LSH tables x bits",
+    )
+    args = parser.parse_args()
+
+    if args.interactions:
+        interactions = pd.read_csv(
+            args.interactions, usecols=["user_id", "item_id"]
+        )
+    else:
+        interactions = synthetic_interactions(args.users, args.items)
+    n_users = interactions["user_id"].nunique()
+    print(f"{len(interactions)} interactions of {n_users} users")
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(n_users, size=min(args.sample, n_users), replace=False)
+
+    recommender = EXACT_RECOMMENDERS[args.weighting]
+    exact = UserKnn(recommender(K=args.n_users), N_users=args.n_users)
+    fit_time = fit(exact, interactions)
+    expected, latencies = lookup(exact, sample)
+    report("exact", fit_time, latencies, 1.0)
+
+    for config in args.configs.split(","):
+        n_tables, n_bits = (int(part) for part in config.split("x"))
+        index = LSHIndex(n_tables, n_bits, weighting=args.weighting)
+        approx = UserKnn(index, N_users=args.n_users)
+        fit_time = fit(approx, interactions)
+        found, latencies = lookup(approx, sample)
+        hits = sum(
+            len(np.intersect1d(ids, exact_ids))
+            for ids, exact_ids in zip(found, expected)
+        )
+        total = sum(len(exact_ids) for exact_ids in expected)
+        report(
+            f"lsh {config}", fit_time, latencies, hits / max(total, 1)
+        )
+
+
+if __name__ == "__main__":
+    main()
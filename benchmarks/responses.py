@@ -0,0 +1,102 @@
+"""Serialisation cost of recommendation and error responses.
+
+    python -m benchmarks.responses [--number 20000]
+
+Compares the way views used to answer, a `RecoResponse` validated
+against the route's response model and rendered by FastAPI's
+`JSONResponse`, with the `ORJSONResponse` they return now, for k=10 and
+k=100. Error bodies are compared with the former stdlib json renderer.
+"""
+import argparse
+import asyncio
+import json
+import time
+import typing as tp
+
+import orjson
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+from pydantic import BaseModel
+
+from service.api.views import RecoResponse, router
+from service.models import Error
+from service.response import ORJSONResponse, create_response
+
+
+class LegacyEncoder(json.JSONEncoder):
+    # the encoder error responses were rendered with before orjson
+    def default(self, o: tp.Any) -> tp.Any:
+        if isinstance(o, BaseModel):
+            return o.dict()
+        try:
+            orjson.dumps(o)
+        except TypeError:
+            return str(o)
+        return super().default(o)
+
+
+def legacy_error(errors: tp.List[Error]) -> bytes:
+    return json.dumps(
+        {"errors": errors},
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        cls=LegacyEncoder,
+    ).encode("utf-8")
+
+
+def per_call(func: tp.Callable[[], tp.Any], number: int) -> float:
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return (time.perf_counter() - start) / number
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=20_000)
+    args = parser.parse_args()
+
+    route = next(
+        route
+        for route in router.routes
+        if isinstance(route, APIRoute)
+        and route.path == "/reco/{model_name}/{user_id}"
+    )
+
+    async def validated(items: tp.List[int], number: int) -> float:
+        # what FastAPI does with a view returning a RecoResponse
+        start = time.perf_counter()
+        for _ in range(number):
+            content = await serialize_response(
+                field=route.secure_cloned_response_field,
+                response_content=RecoResponse(user_id=1, items=items),
+            )
+            JSONResponse(content)
+        return (time.perf_counter() - start) / number
+
+    loop = asyncio.new_event_loop()
+    for k in (10, 100):
+        items = list(range(100_000, 100_000 + k))
+        old = loop.run_until_complete(validated(items, args.number))
+        new = per_call(
+            lambda: ORJSONResponse({"user_id": 1, "items": items}),
+            args.number,
+        )
+        print(
+            f"reco k={k:<4} validated {old * 1e6:8.2f}us  "
+            f"orjson {new * 1e6:8.2f}us  x{old / new:.1f}"
+        )
+
+    errors = [Error(error_key="user_not_found", error_message="Not found")]
+    old = per_call(lambda: legacy_error(errors), args.number)
+    new = per_call(lambda: create_response(404, errors=errors), args.number)
+    print(
+        f"error        json      {old * 1e6:8.2f}us  "
+        f"orjson {new * 1e6:8.2f}us  x{old / new:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,11 @@
+import gc
+import os
+import shutil
 from multiprocessing import cpu_count
 from os import getenv as env
 
 from service import log, settings
+from service.memory import format_memory_usage, get_memory_usage
 
 # The socket to bind.
 host = env("HOST", "0.0.0.0")
@@ -56,6 +60,13 @@ loglevel = env("GUNICORN_LOGLEVEL", "INFO")
 # Redirect stdout/stderr to specified file in errorlog.
 capture_output = env("GUNICORN_CAPTURE_OUTPUT", False)
 
+# Workers write their metrics to files in this directory, any of them serves
+# the sum of all. Files of a previous run are removed before the app is loaded.
+metrics_dir = env("PROMETHEUS_MULTIPROC_DIR")
+if metrics_dir:
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
 # The log config dictionary to use.
 logconfig_dict = log.get_config(settings.get_config())
 
@@ -72,7 +83,8 @@ limit_request_fields = env("GUNICORN_LIMIT_REQUEST_FIELDS", 64)
 limit_request_field_size = env("GUNICORN_LIMIT_REQUEST_FIELD_SIZE", 128)
 
 # Load application code before the worker processes are forked.
-preload_app = env("GUNICORN_PRELOAD_APP", False)
+# Models are then loaded once in the master and shared with workers.
+preload_app = env("GUNICORN_PRELOAD_APP", True)
 
 # Disables the use of sendfile.
 sendfile = env("GUNICORN_SENDFILE", True)
@@ -103,3 +115,50 @@ tmp_upload_dir = env("GUNICORN_TMP_UPLOAD_DIR", None)
 
 # Front-end’s IPs from which allowed to handle set secure headers.
 forwarded_allow_ips = env("GUNICORN_FORWARDER_ALLOW_IPS", "127.0.0.1")
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        # pylint: disable=import-outside-toplevel
+        from service.api.app import load_models
+
+        # models are loaded lazily, build them before workers are forked
+        load_models(server.app.wsgi())
+
+    # Everything loaded so far (the models in particular) is shared with
+    # workers copy-on-write. Move it out of the collector's sight so that
+    # GC passes in workers do not touch and thereby copy those pages.
+    gc.collect()
+    gc.freeze()
+    server.log.info(
+        f"Master memory: {format_memory_usage(get_memory_usage())}"
+    )
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        # pylint: disable=import-outside-toplevel
+        from service.api.app import reset_after_fork
+
+        reset_after_fork(worker.app.wsgi())
+
+
+def post_worker_init(worker):
+    worker.log.info(
+        f"Worker {worker.pid} memory: "
+        f"{format_memory_usage(get_memory_usage())}"
+    )
+
+
+def child_exit(server, worker):
+    # pylint: disable=import-outside-toplevel
+    from service.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
+
+
+def worker_exit(server, worker):
+    server.log.info(
+        f"Worker {worker.pid} memory on exit: "
+        f"{format_memory_usage(get_memory_usage())}"
+    )
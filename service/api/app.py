@@ -1,43 +1,147 @@
 import asyncio
+import time
 from concurrent.futures.thread import ThreadPoolExecutor
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 import uvloop
 from fastapi import FastAPI
 
-from ..log import app_logger, setup_logging
+from ..log import app_logger, reset_logging_after_fork, setup_logging
+from ..metrics import setup_metrics
 from ..settings import ServiceConfig
 from .exception_handlers import add_exception_handlers
+from .executor import PredictionExecutor
 from .middlewares import add_middlewares
+from .models.models_base import create_models_base
+from .models.reco_cache import RecoCache
+from .models.reload import ModelReloader
+from .secure_token import TokenCache
 from .views import add_views
 
-__all__ = ("create_app",)
+__all__ = ("create_app", "load_models", "reset_after_fork")
 
 
-def setup_asyncio(thread_name_prefix: str) -> None:
+def exception_handler(_, context: Dict[str, Any]) -> None:
+    message = "Caught asyncio exception: {message}".format_map(context)
+    app_logger.warning(message)
+
+
+def setup_event_loop(
+    loop: asyncio.AbstractEventLoop,
+    executor: ThreadPoolExecutor,
+) -> None:
+    loop.set_default_executor(executor)
+    loop.set_exception_handler(exception_handler)
+
+
+def setup_asyncio(
+    thread_name_prefix: str,
+    max_workers: Optional[int] = None,
+) -> ThreadPoolExecutor:
     uvloop.install()
 
     loop = asyncio.get_event_loop()
 
-    executor = ThreadPoolExecutor(thread_name_prefix=thread_name_prefix)
-    loop.set_default_executor(executor)
+    executor = ThreadPoolExecutor(
+        max_workers=max_workers, thread_name_prefix=thread_name_prefix
+    )
+    setup_event_loop(loop, executor)
+
+    return executor
+
 
-    def handler(_, context: Dict[str, Any]) -> None:
-        message = "Caught asyncio exception: {message}".format_map(context)
-        app_logger.warning(message)
+def reset_after_fork(app: FastAPI) -> None:
+    """Give a worker forked from a preloaded master its own asyncio state.
 
-    loop.set_exception_handler(handler)
+    Neither the master's event loop nor its thread pool is safe to use
+    in a child, so both are re-created; the serving loop picks up the new
+    pool in the startup handler. The same goes for the logging queue and
+    its listener thread.
+    """
+    reset_logging_after_fork()
+    config: ServiceConfig = app.state.config
+    executor = setup_asyncio(
+        thread_name_prefix=config.service_name,
+        max_workers=config.executor_config.max_workers,
+    )
+    app.state.executor.reset(executor)
+
+
+def load_models(app: FastAPI) -> None:
+    """Load every enabled model that has not been used yet."""
+    start = time.perf_counter()
+    app.state.models.load_all()
+    duration = time.perf_counter() - start
+    app_logger.info(f"Models loaded in {duration:.2f}s")
 
 
 def create_app(config: ServiceConfig) -> FastAPI:
     setup_logging(config)
-    setup_asyncio(thread_name_prefix=config.service_name)
+    setup_metrics(config.metrics_config)
+    executor_config = config.executor_config
+    executor = setup_asyncio(
+        thread_name_prefix=config.service_name,
+        max_workers=executor_config.max_workers,
+    )
 
     app = FastAPI(debug=False)
+    app.state.config = config
     app.state.k_recs = config.k_recs
+    app.state.max_batch_size = config.max_batch_size
+    app.state.max_k_recs = config.max_k_recs
+    app.state.admin_token_hash = config.security_config.admin_token_hash
+    app.state.token_cache = TokenCache(
+        maxsize=config.security_config.token_cache_size,
+        ttl=config.security_config.token_cache_ttl,
+        negative_ttl=config.security_config.token_cache_negative_ttl,
+    )
+    app.state.executor = PredictionExecutor(
+        executor,
+        max_workers=executor_config.max_workers,
+        queue_size=executor_config.queue_size,
+    )
+
+    cache_config = config.reco_cache_config
+    app.state.reco_cache = None
+    if cache_config.enabled:
+        app.state.reco_cache = RecoCache(
+            max_bytes=int(cache_config.max_mb * 2**20),
+            ttl=cache_config.ttl,
+        )
+    models_config = config.models_config
+    app.state.models = create_models_base(
+        models_config.enabled, cache=app.state.reco_cache
+    )
+
+    reload_config = config.reload_config
+    app.state.reloader = ModelReloader(
+        app.state.models,
+        check_users=reload_config.check_users,
+        check_k=config.k_recs,
+        drain_timeout=reload_config.drain_timeout,
+    )
+
+    async def on_startup() -> None:
+        # servers may run the app on a loop other than the one set up above
+        setup_event_loop(
+            asyncio.get_running_loop(), app.state.executor.executor
+        )
+        if models_config.preload:
+            load_models(app)
+        # started here to run in every worker, not in a preloading master
+        if reload_config.watch_interval > 0:
+            app.state.reloader.watch(reload_config.watch_interval)
+
+    async def on_shutdown() -> None:
+        app.state.reloader.stop()
+
+    app.add_event_handler("startup", on_startup)
+    app.add_event_handler("shutdown", on_shutdown)
 
     add_views(app)
-    add_middlewares(app)
+    add_middlewares(
+        app, config.cors_config, config.log_config, config.metrics_config
+    )
     add_exception_handlers(app)
 
     return app
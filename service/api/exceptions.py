@@ -30,6 +30,50 @@ class UserNotFoundError(AppException):
         super().__init__(status_code, error_key, error_message, error_loc)
 
 
+class BatchTooLargeError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+        error_key: str = "batch_too_large",
+        error_message: str = "Too many users in one request",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
+
+
+class TooManyItemsError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.UNPROCESSABLE_ENTITY,
+        error_key: str = "too_many_items",
+        error_message: str = "Too many items requested per user",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
+
+
+class ServiceOverloadedError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.SERVICE_UNAVAILABLE,
+        error_key: str = "service_overloaded",
+        error_message: str = "Too many requests in progress",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
+
+
+class ReloadInProgressError(AppException):
+    def __init__(
+        self,
+        status_code: int = HTTPStatus.CONFLICT,
+        error_key: str = "reload_in_progress",
+        error_message: str = "Model is already being reloaded",
+        error_loc: tp.Optional[tp.Sequence[str]] = None,
+    ):
+        super().__init__(status_code, error_key, error_message, error_loc)
+
+
 class ModelNotFoundError(HTTPException):
     def __init__(
         self,
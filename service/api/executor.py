@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import typing as tp
+from concurrent.futures.thread import ThreadPoolExecutor
+from functools import partial
+
+from fastapi import Request
+
+from ..metrics import executor_pending
+from .exceptions import ServiceOverloadedError
+
+T = tp.TypeVar("T")
+
+
+class PredictionExecutor:
+    """Runs blocking model calls on a thread pool with a bounded backlog.
+
+    At most ``max_workers + queue_size`` calls may be running or waiting
+    at once; anything above that fails fast with `ServiceOverloadedError`
+    instead of queueing up behind slow predictions.
+    """
+
+    def __init__(
+        self,
+        executor: ThreadPoolExecutor,
+        max_workers: int,
+        queue_size: int,
+    ):
+        self.executor = executor
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.capacity = max_workers + queue_size
+
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._gauge = executor_pending()
+
+    def reset(self, executor: ThreadPoolExecutor) -> None:
+        """Switch to a new thread pool, e.g. in a freshly forked worker."""
+        self.executor = executor
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _: tp.Any) -> None:
+        with self._lock:
+            self._pending -= 1
+            if self._gauge:
+                self._gauge.set(self._pending)
+
+    async def run(self, func: tp.Callable[..., T], *args: tp.Any) -> T:
+        with self._lock:
+            if self._pending >= self.capacity:
+                raise ServiceOverloadedError()
+            self._pending += 1
+            if self._gauge:
+                self._gauge.set(self._pending)
+        # the slot is released when the call actually finishes,
+        # even if the awaiting request has already gone away
+        future = self.executor.submit(partial(func, *args))
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+
+async def get_executor(request: Request) -> PredictionExecutor:
+    return request.app.state.executor
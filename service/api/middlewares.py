@@ -1,68 +1,170 @@
+import random
 import time
 
-from fastapi import FastAPI, Request
-from starlette.middleware.base import (
-    BaseHTTPMiddleware,
-    RequestResponseEndpoint,
-)
+from fastapi import FastAPI
+from starlette.datastructures import URL
 from starlette.middleware.cors import CORSMiddleware
-from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from service.log import access_logger, app_logger
+from service.metrics import observe_request
 from service.models import Error
 from service.response import server_error
+from service.settings import CORSConfig, LogConfig, MetricsConfig
 
 
-class AccessMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
+class AccessMiddleware:
+    """Logs HTTP requests with their status code and duration.
+
+    Only a ``sample_rate`` share of requests is logged, except server
+    errors and requests slower than ``slow_threshold`` seconds, which
+    always are.
+    """
+
+    def __init__(
         self,
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
+        app: ASGIApp,
+        sample_rate: float = 1.0,
+        slow_threshold: float = 1.0,
+    ) -> None:
+        self.app = app
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
         started_at = time.perf_counter()
-        response = await call_next(request)
-        request_time = time.perf_counter() - started_at
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
 
-        status_code = response.status_code
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            request_time = time.perf_counter() - started_at
+            if (
+                self.sample_rate >= 1
+                or status_code >= 500
+                or request_time >= self.slow_threshold
+                or random.random() < self.sample_rate
+            ):
+                self._log(scope, status_code, request_time)
 
+    @staticmethod
+    def _log(scope: Scope, status_code: int, request_time: float) -> None:
         access_logger.info(
             msg="",
             extra={
                 "request_time": round(request_time, 4),
                 "status_code": status_code,
-                "requested_url": request.url,
-                "method": request.method,
+                "requested_url": URL(scope=scope),
+                "method": scope["method"],
             },
         )
-        return response
 
 
-class ExceptionHandlerMiddleware(BaseHTTPMiddleware):
-    async def dispatch(
-        self,
-        request: Request,
-        call_next: RequestResponseEndpoint,
-    ) -> Response:
+class MetricsMiddleware:
+    """Observes the duration of HTTP requests by model and status code."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            observe_request(
+                self._model_name(scope),
+                status_code,
+                time.perf_counter() - started_at,
+            )
+
+    @staticmethod
+    def _model_name(scope: Scope) -> str:
+        # the router sets the path parameters of the matched route
+        model_name = scope.get("path_params", {}).get("model_name")
+        if model_name is None:
+            return ""
+        # names sent by clients must not create new label values
+        if not scope["app"].state.models.check_model(model_name):
+            return "unknown"
+        return model_name
+
+
+class ExceptionHandlerMiddleware:
+    """Answers unhandled exceptions with a generic server error."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_tracking_start(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send_tracking_start)
         except Exception as e:  # pylint: disable=W0703,W1203
             app_logger.exception(
                 msg=f"Caught unhandled {e.__class__} exception: {e}"
             )
+            # a response already on its way cannot be replaced
+            if response_started:
+                raise
             error = Error(
                 error_key="server_error", error_message="Internal Server Error"
             )
-            return server_error([error])
+            await server_error([error])(scope, receive, send)
 
 
-def add_middlewares(app: FastAPI) -> None:
+def add_middlewares(
+    app: FastAPI,
+    cors_config: CORSConfig,
+    log_config: LogConfig,
+    metrics_config: MetricsConfig,
+) -> None:
     # do not change order
     app.add_middleware(ExceptionHandlerMiddleware)
-    app.add_middleware(AccessMiddleware)
+    if metrics_config.enabled:
+        app.add_middleware(MetricsMiddleware)
     app.add_middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_credentials=True,
-        allow_methods=["*"],
-        allow_headers=["*"],
+        AccessMiddleware,
+        sample_rate=log_config.access_sample_rate,
+        slow_threshold=log_config.access_slow_threshold,
     )
+    if cors_config.enabled:
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=cors_config.allow_origins,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from service.api.models.knn_index import SortedIdMap
+from service.log import app_logger
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# every export writes its arrays to a new directory named by this prefix
+VERSION_PREFIX = "v"
+
+# arrays of a segment model, saved as <name>.npy
+SEGMENT_ARRAYS = (
+    "users_inv_array",
+    "items_inv_array",
+    "watched_indptr",
+    "watched_indices",
+    "item_idf_array",
+    "neighbours",
+    "neighbour_sims",
+)
+
+
+class KNNSegment:
+    """Serving view of a fitted `UserKnn` loaded from an artifact directory.
+
+    Exposes the attributes `KNNModel` reads from a segment model; every
+    array is memory-mapped, so forked workers share the same pages.
+    """
+
+    user_knn = None
+
+    def __init__(self, N_users: int, **arrays: np.ndarray):
+        self.N_users = N_users
+        for name in SEGMENT_ARRAYS:
+            setattr(self, name, arrays[name])
+        self.users_mapping = SortedIdMap(
+            arrays["sorted_user_ids"], arrays["sorted_user_rows"]
+        )
+
+
+def _save(path: str, directory: str, name: str, array: np.ndarray) -> str:
+    """Save ``array`` to ``directory`` of ``path``, return its path
+    relative to ``path``.
+    """
+    filename = os.path.join(directory, f"{name}.npy")
+    np.save(os.path.join(path, filename), np.ascontiguousarray(array))
+    return filename
+
+
+def read_version(path: str) -> Optional[str]:
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            return json.load(f).get("version")
+    except FileNotFoundError:
+        return None
+
+
+def new_version(path: str) -> str:
+    """Create a version directory in ``path`` and return its name."""
+    version = f"{VERSION_PREFIX}{time.time_ns()}"
+    os.makedirs(os.path.join(path, version))
+    return version
+
+
+def switch_version(
+    path: str,
+    manifest: Dict[str, Any],
+    previous: Optional[str],
+) -> None:
+    """Atomically replace the manifest of ``path`` by ``manifest``, then
+    remove versions older than ``previous``.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    with open(f"{manifest_path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    keep = (manifest["version"], previous)
+    for name in os.listdir(path):
+        if name.startswith(VERSION_PREFIX) and name not in keep:
+            # workers still mapping these files keep their pages
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def export_artifacts(
+    path: str,
+    user_segment_map: Dict[int, int],
+    segment_model_map: Dict[int, Any],
+    pop_items: Any,
+) -> None:
+    """Write kNN models as a directory of ``.npy`` arrays and a manifest.
+
+    Serving workers may have the arrays of the previous export mapped,
+    and rewriting a mapped file under them is a crash or a mix of old and
+    new values. So the arrays go to a new version directory, the manifest
+    is then replaced atomically, and only versions older than the
+    previous one are removed.
+    """
+    os.makedirs(path, exist_ok=True)
+    previous = read_version(path)
+    version = new_version(path)
+    users = SortedIdMap.from_unsorted(
+        np.fromiter(user_segment_map.keys(), dtype=np.int64),
+        np.fromiter(user_segment_map.values(), dtype=np.int64),
+    )
+    manifest: Dict[str, Any] = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "user_ids": _save(path, version, "user_ids", users.keys_array),
+        "user_segments": _save(
+            path, version, "user_segments", users.values_array
+        ),
+        "pop_items": _save(path, version, "pop_items", np.asarray(pop_items)),
+        "segments": {},
+    }
+
+    for segment, model in segment_model_map.items():
+        segment_dir = os.path.join(version, "segments", str(segment))
+        os.makedirs(os.path.join(path, segment_dir), exist_ok=True)
+        arrays = {name: getattr(model, name) for name in SEGMENT_ARRAYS}
+        order = np.argsort(model.users_inv_array, kind="stable")
+        arrays["sorted_user_ids"] = model.users_inv_array[order]
+        arrays["sorted_user_rows"] = order.astype(np.int32)
+        files = {}
+        for name, array in arrays.items():
+            files[name] = _save(path, segment_dir, name, array)
+        manifest["segments"][str(segment)] = {
+            "N_users": model.N_users,
+            "arrays": files,
+        }
+
+    switch_version(path, manifest, previous)
+
+
+def load_artifacts(
+    path: str,
+    mmap: bool = True,
+) -> Tuple[SortedIdMap, Dict[int, KNNSegment], np.ndarray]:
+    """Load what `export_artifacts` wrote.
+
+    Returns the user -> segment map, segment models and popular items.
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported artifacts version: {manifest['format_version']}"
+        )
+
+    mmap_mode = "r" if mmap else None
+
+    def load(filename: str) -> np.ndarray:
+        return np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+
+    user_segment_map = SortedIdMap(
+        load(manifest["user_ids"]), load(manifest["user_segments"])
+    )
+    segment_model_map = {
+        int(segment): KNNSegment(
+            N_users=meta["N_users"],
+            **{name: load(f) for name, f in meta["arrays"].items()},
+        )
+        for segment, meta in manifest["segments"].items()
+    }
+    return user_segment_map, segment_model_map, load(manifest["pop_items"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Export kNN models to a memory-mappable directory."
+    )
+    parser.add_argument("output", help="directory to write artifacts to")
+    args = parser.parse_args()
+
+    # pylint: disable=import-outside-toplevel
+    from service.api.models.knn_model import load_knn_model
+
+    knn_model = load_knn_model()
+    export_artifacts(
+        args.output,
+        knn_model.user_segment_map,
+        knn_model.segment_model_map,
+        knn_model.pop_items,
+    )
+    app_logger.info(f"Exported kNN artifacts to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
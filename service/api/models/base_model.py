@@ -3,9 +3,23 @@ from typing import List
 
 
 class BaseModel(ABC):
+    # cheap models are called right on the event loop,
+    # the others are offloaded to the prediction executor
+    lightweight: bool = False
+
     def __init__(self, model_name: str):
         self.model_name = model_name
 
     @abstractmethod
     def predict(self, user_id: int, k: int) -> List[int]:
         pass
+
+    def is_cold(self, user_id: int) -> bool:
+        """Whether ``user_id`` is answered without the model itself.
+
+        Cold users are served on the event loop and are not cached.
+        """
+        return False
+
+    def predict_batch(self, user_ids: List[int], k: int) -> List[List[int]]:
+        return [self.predict(user_id, k) for user_id in user_ids]
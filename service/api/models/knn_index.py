@@ -0,0 +1,162 @@
+from collections.abc import Mapping
+from typing import Any, Iterator, Tuple
+
+import numpy as np
+
+
+def gather_rows(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    rows: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate rows of a CSR structure without a python loop.
+
+    Returns positions in ``rows`` each value came from and the values.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = indptr[rows].astype(np.int64)
+    lengths = indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(
+        np.cumsum(lengths) - lengths, lengths
+    )
+    return owners, indices[np.repeat(starts, lengths) + offsets]
+
+
+def similar_users(
+    model: Any,
+    inner_user_id: int,
+    n: int,
+    max_sim: float = 1.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Nearest users of ``inner_user_id`` from an implicit recommender.
+
+    The user itself and neighbours with similarity >= ``max_sim`` are
+    dropped.
+    """
+    result = model.similar_items(inner_user_id, N=n)
+    if isinstance(result, tuple):
+        # implicit>=0.5 returns (ids, scores) arrays
+        ids, sims = result
+    else:
+        ids = np.array([user for user, _ in result], dtype=np.int64)
+        sims = np.array([sim for _, sim in result], dtype=np.float64)
+    # exclude the same user, take rates lower than max_sim:
+    ids, sims = np.asarray(ids)[1:], np.asarray(sims)[1:]
+    mask = sims < max_sim
+    return ids[mask].astype(np.int64), sims[mask].astype(np.float64)
+
+
+def neighbour_table(
+    model: Any,
+    n_users: int,
+    n: int,
+    max_sim: float = 1.0,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Fixed-width table of `similar_users` for every inner user id.
+
+    Rows are padded with -1 ids and zero similarities.
+    """
+    width = max(n - 1, 0)
+    ids = np.full((n_users, width), -1, dtype=np.int32)
+    sims = np.zeros((n_users, width), dtype=np.float32)
+    for user in range(n_users):
+        row_ids, row_sims = similar_users(model, user, n, max_sim)
+        ids[user, : len(row_ids)] = row_ids
+        sims[user, : len(row_sims)] = row_sims
+    return ids, sims
+
+
+def row_ranks(
+    rows: np.ndarray,
+    values: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Order COO entries by row, then by descending value.
+
+    Returns the order and the rank of every ordered entry in its row.
+    """
+    order = np.argsort(-values, kind="stable")
+    order = order[np.argsort(rows[order], kind="stable")]
+    sorted_rows = rows[order]
+    ranks = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows)
+    return order, ranks
+
+
+def fill_neighbours(
+    similarity: Any,
+    ids: np.ndarray,
+    sims: np.ndarray,
+    users: np.ndarray,
+    n: int,
+    max_sim: float = 1.0,
+) -> None:
+    """Rewrite the rows of ``users`` in a `neighbour_table` in place.
+
+    Neighbours are read from the CSR ``similarity`` matrix of an implicit
+    nearest neighbours model the way `similar_users` finds them.
+    """
+    owners, cols = gather_rows(similarity.indptr, similarity.indices, users)
+    _, values = gather_rows(similarity.indptr, similarity.data, users)
+    order, ranks = row_ranks(owners, values)
+    owners, cols, values = owners[order], cols[order], values[order]
+    # the n most similar users, the first of them being the user itself
+    keep = (ranks > 0) & (ranks < n) & (values < max_sim)
+    owners, cols, values = owners[keep], cols[keep], values[keep]
+    positions = np.arange(len(owners)) - np.searchsorted(owners, owners)
+    ids[users] = -1
+    sims[users] = 0
+    ids[users[owners], positions] = cols
+    sims[users[owners], positions] = values
+
+
+def table_neighbours(
+    ids: np.ndarray,
+    sims: np.ndarray,
+    inner_user_id: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Neighbours of ``inner_user_id`` read from a `neighbour_table`."""
+    row = ids[inner_user_id]
+    n = np.count_nonzero(row >= 0)
+    return row[:n], sims[inner_user_id, :n]
+
+
+class SortedIdMap(Mapping):
+    """Read-only id -> value mapping backed by two aligned arrays.
+
+    ``keys`` must be sorted; lookups are a binary search, so both arrays
+    can stay memory-mapped.
+    """
+
+    def __init__(self, keys: np.ndarray, values: np.ndarray):
+        self.keys_array = keys
+        self.values_array = values
+
+    @classmethod
+    def from_unsorted(cls, keys: np.ndarray, values: np.ndarray):
+        order = np.argsort(keys, kind="stable")
+        return cls(np.asarray(keys)[order], np.asarray(values)[order])
+
+    def _find(self, key: Any) -> int:
+        pos = int(np.searchsorted(self.keys_array, key))
+        if pos < len(self.keys_array) and self.keys_array[pos] == key:
+            return pos
+        return -1
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        pos = self._find(key)
+        return default if pos < 0 else self.values_array[pos]
+
+    def __getitem__(self, key: Any) -> Any:
+        pos = self._find(key)
+        if pos < 0:
+            raise KeyError(key)
+        return self.values_array[pos]
+
+    def __contains__(self, key: Any) -> bool:
+        return self._find(key) >= 0
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.keys_array.tolist())
+
+    def __len__(self) -> int:
+        return len(self.keys_array)
@@ -1,10 +1,61 @@
-from typing import Any, Dict, List, Tuple, Union
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import dill
+import numpy as np
 import pandas as pd
 
+from service.api.models.artifacts import MANIFEST_FILE, load_artifacts
 from service.api.models.base_model import BaseModel
+from service.api.models.knn_index import (
+    gather_rows,
+    similar_users,
+    table_neighbours,
+)
+from service.api.models.popular import PopularItems
+from service.api.models.scoring import (
+    DEDUP_METHODS,
+    rank_batch,
+    score_candidates,
+    top_k,
+)
 from service.log import app_logger
+from service.metrics import stage_timer
+
+# "pandas" is the reference implementation, kept to check parity
+SCORING_METHODS = ("numpy", "pandas")
+
+
+def rank_segment(
+    model: Any,
+    inner_user_ids: List[int],
+    k: int,
+    dedup: str = "first",
+) -> List[np.ndarray]:
+    """Top-``k`` inner item ids of users of one segment model, from its
+    neighbour table, without popular items.
+    """
+    # neighbours of all users, row by row:
+    neighbours = model.neighbours[inner_user_ids]
+    rows, cols = np.nonzero(neighbours >= 0)
+    # items of all neighbours, scored and ranked in one pass:
+    owners, items = gather_rows(
+        model.watched_indptr,
+        model.watched_indices,
+        neighbours[rows, cols],
+    )
+    sims = model.neighbour_sims[inner_user_ids][rows, cols]
+    return rank_batch(
+        rows[owners],
+        items,
+        sims[owners],
+        model.item_idf_array,
+        len(inner_user_ids),
+        k,
+        dedup,
+    )
 
 
 class KNNModel(BaseModel):
@@ -16,64 +67,165 @@ class KNNModel(BaseModel):
         segment_model_map: Dict[int, Any],
         pop_items: List[int],
         warmup_k: int = None,
+        scoring: str = "numpy",
+        dedup: str = "first",
     ):
+        if scoring not in SCORING_METHODS:
+            raise ValueError(f"Unknown scoring method: {scoring}")
+        if dedup not in DEDUP_METHODS:
+            raise ValueError(f"Unknown dedup method: {dedup}")
         super().__init__(self.model_name)
         self.user_segment_map = user_segment_map
         self.segment_model_map = segment_model_map
         self.pop_items = pop_items
+        self.popular = PopularItems.from_segment_models(
+            pop_items, segment_model_map
+        )
         self.warmup_k = 10 if warmup_k is None else warmup_k
+        self.scoring = scoring
+        self.dedup = dedup
+        # None when metrics are disabled
+        self.timer = stage_timer(self.model_name)
 
     def predict(self, user_id: int, k: int) -> List[int]:
+        timer = self.timer
+        start = time.perf_counter() if timer else 0.0
         user_segment = self.user_segment_map.get(user_id)
-        if user_segment is None:
-            return self._predict_popular(k)
+        in_model = self._in_model(user_id, user_segment)
+        if timer:
+            start = timer.lap("segment_lookup", start)
+        if not in_model:
+            recs = self._predict_popular(k, user_segment)
+            if timer:
+                timer.lap("popular_backfill", start)
+            return recs
         else:
             return self._predict_by_model(user_id, user_segment, k)
 
-    def _predict_popular(self, k: int) -> List[int]:
-        return list(self.pop_items)[:k]
+    def is_cold(self, user_id: int) -> bool:
+        return not self._in_model(
+            user_id, self.user_segment_map.get(user_id)
+        )
+
+    def _in_model(self, user_id: int, user_segment: Optional[int]) -> bool:
+        if user_segment is None:
+            return False
+        model = self.segment_model_map.get(user_segment)
+        # users of a segment may be missing from its model,
+        # they get the popular items of the segment
+        return model is not None and user_id in model.users_mapping
+
+    def predict_batch(self, user_ids: List[int], k: int) -> List[List[int]]:
+        if self.scoring == "pandas":
+            return super().predict_batch(user_ids, k)
+
+        recs: List[List[int]] = [[] for _ in user_ids]
+        segment_positions: Dict[int, List[int]] = defaultdict(list)
+        for pos, user_id in enumerate(user_ids):
+            user_segment = self.user_segment_map.get(user_id)
+            if not self._in_model(user_id, user_segment):
+                recs[pos] = self._predict_popular(k, user_segment)
+            else:
+                segment_positions[user_segment].append(pos)
+
+        for user_segment, positions in segment_positions.items():
+            segment_recs = self._predict_segment(
+                [user_ids[pos] for pos in positions], user_segment, k
+            )
+            for pos, user_recs in zip(positions, segment_recs):
+                recs[pos] = user_recs
+        return recs
+
+    def _predict_segment(
+        self, user_ids: List[int], user_segment: int, k: int
+    ) -> List[List[int]]:
+        model = self.segment_model_map[user_segment]
+        if getattr(model, "neighbours", None) is None:
+            return [
+                self._predict_by_model(user_id, user_segment, k)
+                for user_id in user_ids
+            ]
+        inner_user_ids = [model.users_mapping[user_id] for user_id in user_ids]
+        ranked = rank_segment(model, inner_user_ids, k, self.dedup)
+        return [
+            self.popular.complete(
+                model.items_inv_array[user_items].tolist(), k, user_segment
+            )
+            for user_items in ranked
+        ]
+
+    def _predict_popular(
+        self, k: int, user_segment: Optional[int] = None
+    ) -> List[int]:
+        return self.popular.recommend(k, user_segment)
 
     def _get_similar_users(
         self,
         user_id: int,
         user_segment: int,
-    ) -> Tuple[List[int], List[float]]:
+    ) -> Tuple[np.ndarray, np.ndarray]:
         # take segment model:
         model = self.segment_model_map[user_segment]
         # find similar users:
         inner_user_id = model.users_mapping[user_id]
-        sim_items_rates = model.user_knn.similar_items(
-            inner_user_id, N=model.N_users
-        )[
-            1:
-        ]  # exclude the same user
-        # take rates lower than 1:
-        sim = list(filter(lambda x: x[1] < 1, sim_items_rates))
-        return (
-            [model.users_inv_mapping[user] for user, _ in sim],
-            [user_s for _, user_s in sim],
+        if getattr(model, "neighbours", None) is None:
+            return similar_users(model.user_knn, inner_user_id, model.N_users)
+        return table_neighbours(
+            model.neighbours, model.neighbour_sims, inner_user_id
         )
 
     def _predict_by_model(
         self, user_id: int, user_segment: int, k: int
     ) -> List[int]:
-        # get similar users (ids and scores):
+        timer = self.timer
+        start = time.perf_counter() if timer else 0.0
+        # get similar users (inner ids and scores):
         sim_users, sim_score = self._get_similar_users(user_id, user_segment)
-        # prepare df to sort items of similar users:
+        if timer:
+            start = timer.lap("similar_items", start)
+        # items of similar users, as slices of the CSR index:
         model = self.segment_model_map[user_segment]
-        sim_users_items = model.watched.loc[sim_users]
-        sim_users_items["sim"] = sim_score
+        owners, items = gather_rows(
+            model.watched_indptr, model.watched_indices, sim_users
+        )
+        if self.scoring == "pandas":
+            recs = self._rank_pandas(model, items, sim_score[owners], k)
+        else:
+            recs = self._rank_numpy(model, items, sim_score[owners], k)
+        if timer:
+            start = timer.lap("scoring", start)
+        # complete with popular:
+        recs = self.popular.complete(recs, k, user_segment)
+        if timer:
+            timer.lap("popular_backfill", start)
+        return recs
+
+    def _rank_numpy(
+        self, model: Any, items: np.ndarray, sims: np.ndarray, k: int
+    ) -> List[int]:
+        items, scores = score_candidates(
+            items, sims, model.item_idf_array, self.dedup
+        )
+        return model.items_inv_array[top_k(items, scores, k)].tolist()
+
+    def _rank_pandas(
+        self, model: Any, items: np.ndarray, sims: np.ndarray, k: int
+    ) -> List[int]:
+        sim_users_items = pd.DataFrame(
+            {
+                "item_id": model.items_inv_array[items],
+                "sim": sims,
+                # idf of items of similar users:
+                "idf": model.item_idf_array[items],
+            }
+        )
         # evaluate score:
-        sim_users_items = (
-            # items of similar users:
-            sim_users_items.explode("item_id")
-            .reset_index()
-            .rename(columns={"user_id": "sim_user_id"})
-            .drop_duplicates(["item_id"], keep="first")
-            # idf of items of similar users:
-            .merge(
-                model.item_idf, left_on="item_id", right_on="index", how="left"
+        if self.dedup == "max":
+            sim_users_items = sim_users_items.sort_values(
+                ["sim"], ascending=False, kind="stable"
             )
+        sim_users_items = sim_users_items.drop_duplicates(
+            ["item_id"], keep="first"
         )
         # final score:
         sim_users_items["score"] = (
@@ -81,16 +233,9 @@ class KNNModel(BaseModel):
         )
         # sort by score:
         sim_users_items = sim_users_items.sort_values(
-            ["score"], ascending=False
+            ["score"], ascending=False, kind="stable"
         )
-        recs = sim_users_items["item_id"].iloc[:k].tolist()
-        # complete with popular:
-        if len(recs) < k:
-            pop = list(
-                filter(lambda x: x not in recs, self._predict_popular(k))
-            )
-            recs = (recs + pop)[:k]
-        return recs
+        return sim_users_items["item_id"].iloc[:k].tolist()
 
     def warmup(self, users_ids: List[int]) -> None:
         for user_id in users_ids:
@@ -110,11 +255,15 @@ class KNNModelConfig:
         sub_estimators_path: str,
         items_pop_ordered_path: str,
         warmup_users_path: Union[str, None],
+        scoring: str = "numpy",
+        artifacts_path: Union[str, None] = None,
     ):
         self.users_segment_map_path = users_segment_map_path
         self.sub_estimators_path = sub_estimators_path
         self.items_pop_ordered_path = items_pop_ordered_path
         self.warmup_users_path = warmup_users_path
+        self.scoring = scoring
+        self.artifacts_path = artifacts_path
 
         self.users_segment_map: Dict[int, int] = None
         self.sub_estimators: Dict[int, Any] = None
@@ -122,9 +271,16 @@ class KNNModelConfig:
         self.warmup_users: Union[List[int], None] = None
 
     def parse(self) -> None:
-        self.users_segment_map = read_dill(self.users_segment_map_path)
-        self.sub_estimators = read_dill(self.sub_estimators_path)
-        self.items_pop_ordered = read_dill(self.items_pop_ordered_path)
+        if self.artifacts_path is not None:
+            (
+                self.users_segment_map,
+                self.sub_estimators,
+                self.items_pop_ordered,
+            ) = load_artifacts(self.artifacts_path)
+        else:
+            self.users_segment_map = read_dill(self.users_segment_map_path)
+            self.sub_estimators = read_dill(self.sub_estimators_path)
+            self.items_pop_ordered = read_dill(self.items_pop_ordered_path)
         if self.warmup_users_path is not None:
             self.warmup_users = pd.read_csv(self.warmup_users_path)[
                 "user_id"
@@ -140,10 +296,19 @@ class KNNModelInitializer:
 
     def init_model(self) -> KNNModel:
         self.config.parse()
+        for segment, sub_estimator in self.config.sub_estimators.items():
+            # models saved without a neighbour table get it once at load
+            if getattr(sub_estimator, "neighbours", None) is None:
+                app_logger.info(f"Building neighbours of segment {segment}")
+                sub_estimator.build_neighbours()
+            # fitted models build the id lookup lazily, do it before
+            # workers fork so that they share it
+            _ = sub_estimator.users_mapping
         model = KNNModel(
             user_segment_map=self.config.users_segment_map,
             segment_model_map=self.config.sub_estimators,
             pop_items=self.config.items_pop_ordered,
+            scoring=self.config.scoring,
         )
         if self.config.warmup_users is not None:
             print("-" * 30)
@@ -152,14 +317,39 @@ class KNNModelInitializer:
         return model
 
 
-# https://drive.google.com/file/d/1AVi5ztfkD0Ud0PZH0V8cm2KOZLpZYK8D/view?usp=sharing
-knn_model_config = KNNModelConfig(
-    users_segment_map_path="service/api/models/files/users_segment_map.dill",
-    sub_estimators_path="service/api/models/files/segment_model_map.dill",
-    items_pop_ordered_path="service/api/models/files/items_pop_ordered.dill",
-    warmup_users_path=None,
+KNN_FILES_PATH = "service/api/models/files"
+KNN_ARTIFACTS_PATH = os.path.join(KNN_FILES_PATH, "knn_artifacts")
+KNN_DILL_PATHS = {
+    "users_segment_map_path": os.path.join(
+        KNN_FILES_PATH, "users_segment_map.dill"
+    ),
+    "sub_estimators_path": os.path.join(
+        KNN_FILES_PATH, "segment_model_map.dill"
+    ),
+    "items_pop_ordered_path": os.path.join(
+        KNN_FILES_PATH, "items_pop_ordered.dill"
+    ),
+}
+# files whose change means a new model, the manifest is written last
+KNN_MODEL_PATHS = (
+    os.path.join(KNN_ARTIFACTS_PATH, MANIFEST_FILE),
+    *KNN_DILL_PATHS.values(),
 )
 
-knn_model_initializer = KNNModelInitializer(knn_model_config)
-app_logger.info("kNN Model initialization...")
-knn_model = knn_model_initializer.init_model()
+
+def get_knn_model_config() -> KNNModelConfig:
+    # https://drive.google.com/file/d/1AVi5ztfkD0Ud0PZH0V8cm2KOZLpZYK8D/view?usp=sharing
+    return KNNModelConfig(
+        **KNN_DILL_PATHS,
+        warmup_users_path=None,
+        # built with `python -m service.api.models.artifacts`,
+        # preferred over the dill files when present
+        artifacts_path=(
+            KNN_ARTIFACTS_PATH if os.path.isdir(KNN_ARTIFACTS_PATH) else None
+        ),
+    )
+
+
+def load_knn_model() -> KNNModel:
+    app_logger.info("kNN Model initialization...")
+    return KNNModelInitializer(get_knn_model_config()).init_model()
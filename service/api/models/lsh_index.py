@@ -0,0 +1,242 @@
+from functools import partial
+from typing import Tuple
+
+import numpy as np
+import scipy as sp
+
+# user weightings of the exact implicit recommenders they approximate
+LSH_WEIGHTINGS = ("cosine", "tfidf")
+# about as many array entries are built at once for the similarity matrix
+MAX_CHUNK_WORK = 64_000_000
+
+
+class LSHIndex:
+    """Approximate nearest users by random-projection LSH.
+
+    A drop-in neighbour backend for `userknn.UserKnn`: it is fitted on
+    the user-items matrix and answers ``similar_items`` like an implicit
+    ``ItemItemRecommender`` over users, the user itself first.
+
+    Every user vector is hashed in ``n_tables`` tables by the signs of
+    ``n_bits`` random projections. Users sharing a bucket with the query
+    in any table are candidates, ranked by their exact cosine similarity.
+    More tables raise recall, more bits cut the number of candidates.
+
+    Like implicit, `fit` keeps the ``K`` most similar users of every user
+    in the CSR ``similarity`` matrix, from which `userknn.UserKnn` builds
+    its neighbour table. With few bits nearly all overlapping users are
+    candidates and it costs about as much as the exact similarities.
+    """
+
+    def __init__(
+        self,
+        n_tables: int = 32,
+        n_bits: int = 6,
+        weighting: str = "cosine",
+        seed: int = 0,
+        K: int = 100,
+    ):
+        if weighting not in LSH_WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting}")
+        if not 0 < n_bits < 63:
+            raise ValueError("n_bits must be between 1 and 62")
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.weighting = weighting
+        self.seed = seed
+        self.K = K
+
+    def _weigh(self, user_items: sp.sparse.csr_matrix) -> sp.sparse.csr_matrix:
+        vectors = sp.sparse.csr_matrix(user_items, dtype=np.float32, copy=True)
+        if self.weighting == "tfidf":
+            # the weighting of implicit's TFIDFRecommender
+            doc_freq = np.bincount(vectors.indices, minlength=vectors.shape[1])
+            idf = np.log(vectors.shape[0]) - np.log1p(doc_freq)
+            vectors.data = np.sqrt(vectors.data) * idf[vectors.indices]
+        norms = np.sqrt(vectors.multiply(vectors).sum(axis=1)).A1
+        norms[norms == 0] = 1
+        return sp.sparse.diags(1 / norms).astype(np.float32) @ vectors
+
+    def fit(self, user_items: sp.sparse.csr_matrix) -> "LSHIndex":
+        self.vectors = self._weigh(user_items).tocsr()
+        rng = np.random.default_rng(self.seed)
+        planes = rng.standard_normal(
+            (self.vectors.shape[1], self.n_tables * self.n_bits),
+            dtype=np.float32,
+        )
+        signs = (self.vectors @ planes) > 0
+        powers = np.left_shift(1, np.arange(self.n_bits, dtype=np.int64))
+        self.codes = (
+            signs.reshape(-1, self.n_tables, self.n_bits) @ powers
+        ).T.copy()
+        # users of every table sorted by code, buckets are ranges of them
+        self.order = np.argsort(self.codes, axis=1, kind="stable").astype(
+            np.int32
+        )
+        self.sorted_codes = np.take_along_axis(self.codes, self.order, axis=1)
+        self.similarity = self._similarity()
+        return self
+
+    def _bucket_ids(self) -> np.ndarray:
+        """Users x tables, the bucket of a user in every table numbered
+        from 0 in the smallest dtype that fits them.
+        """
+        ids = np.stack(
+            [np.unique(codes, return_inverse=True)[1] for codes in self.codes],
+            axis=1,
+        )
+        return ids.astype(np.min_scalar_type(ids.max()))
+
+    def _buckets(self, bucket_ids: np.ndarray) -> sp.sparse.csr_matrix:
+        """Users x buckets of all tables, a user has one in every table."""
+        sizes = bucket_ids.max(axis=0).astype(np.int64) + 1
+        offsets = np.cumsum(sizes) - sizes
+        return sp.sparse.csr_matrix(
+            (
+                np.ones(bucket_ids.size, dtype=np.float32),
+                (bucket_ids + offsets).ravel(),
+                np.arange(0, bucket_ids.size + 1, self.n_tables),
+            ),
+            shape=(len(bucket_ids), sizes.sum()),
+        )
+
+    def _score_candidates(
+        self,
+        buckets: sp.sparse.csr_matrix,
+        transposed: sp.sparse.csr_matrix,
+        start: int,
+        end: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Similarities of users ``start:end`` and their candidates."""
+        candidates = buckets[start:end] @ transposed
+        candidates.sort_indices()
+        rows = start + np.repeat(
+            np.arange(end - start), np.diff(candidates.indptr)
+        )
+        cols = candidates.indices
+        sims = self.vectors[rows].multiply(self.vectors[cols]).sum(axis=1)
+        return rows, cols, np.asarray(sims).ravel()
+
+    def _score_overlaps(
+        self,
+        bucket_ids: np.ndarray,
+        transposed: sp.sparse.csr_matrix,
+        start: int,
+        end: int,
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Similarities of users ``start:end`` and the overlapping users
+        they share a bucket with.
+        """
+        overlaps = self.vectors[start:end] @ transposed
+        overlaps.sort_indices()
+        rows = start + np.repeat(
+            np.arange(end - start), np.diff(overlaps.indptr)
+        )
+        cols = overlaps.indices
+        shared = (bucket_ids[rows] == bucket_ids[cols]).any(axis=1)
+        shared |= rows == cols
+        return rows[shared], cols[shared], overlaps.data[shared]
+
+    def _similarity(self) -> sp.sparse.csr_matrix:
+        """Top-``K`` candidates of every user by exact similarity, found
+        in chunks of users as `similar_items` finds them.
+
+        Candidates are either scored pair by pair, or the similarities
+        of all overlapping users are computed at once and kept for the
+        pairs sharing a bucket, whichever builds fewer array entries.
+        With few bits most users are candidates and the latter wins.
+        """
+        n_users = self.vectors.shape[0]
+        bucket_ids = self._bucket_ids()
+        buckets = self._buckets(bucket_ids)
+        bucket_sizes = np.asarray(buckets.sum(axis=0)).ravel()
+        # every user has at most this many candidates
+        n_candidates = buckets @ bucket_sizes
+        # and at most this many overlapping users
+        items = self.vectors.copy()
+        items.data[:] = 1
+        n_overlaps = items @ np.bincount(
+            items.indices, minlength=items.shape[1]
+        )
+        candidate_work = n_candidates * (self.vectors.nnz / n_users)
+        overlap_work = n_overlaps * self.n_tables
+        if candidate_work.sum() <= overlap_work.sum():
+            bounds = np.cumsum(candidate_work)
+            score = partial(
+                self._score_candidates, buckets, buckets.T.tocsr()
+            )
+        else:
+            bounds = np.cumsum(overlap_work)
+            score = partial(
+                self._score_overlaps, bucket_ids, self.vectors.T.tocsr()
+            )
+        rows, cols, data = [], [], []
+        start = 0
+        while start < n_users:
+            done = bounds[start - 1] if start else 0
+            end = np.searchsorted(bounds, done + MAX_CHUNK_WORK, side="right")
+            end = min(max(end, start + 1), n_users)
+            chunk_rows, chunk_cols, sims = score(start, end)
+            own = chunk_rows == chunk_cols
+            # users are their own most similar one, as in similar_items
+            sims[own] = 1.0
+            keep = (sims > 0) | own
+            chunk_rows, chunk_cols, sims = (
+                chunk_rows[keep],
+                chunk_cols[keep],
+                sims[keep],
+            )
+            keys = np.where(own[keep], np.inf, sims).astype(np.float32)
+            # a single sort by row, then by descending similarity: the
+            # bits of non-negative floats are ordered like their values
+            keys = (chunk_rows.astype(np.int64) << 32) | (
+                0xFFFFFFFF - keys.view(np.uint32).astype(np.int64)
+            )
+            order = np.argsort(keys, kind="stable")
+            sorted_rows = chunk_rows[order]
+            ranks = np.arange(len(order)) - np.searchsorted(
+                sorted_rows, sorted_rows
+            )
+            top = np.sort(order[ranks < self.K])
+            rows.append(chunk_rows[top])
+            cols.append(chunk_cols[top])
+            data.append(sims[top])
+            start = end
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        indptr = np.searchsorted(rows, np.arange(n_users + 1))
+        return sp.sparse.csr_matrix(
+            (np.concatenate(data), cols, indptr), shape=(n_users, n_users)
+        )
+
+    def candidates(self, user: int) -> np.ndarray:
+        """Users sharing a bucket with ``user`` in any table."""
+        found = []
+        for table in range(self.n_tables):
+            code = self.codes[table, user]
+            sorted_codes = self.sorted_codes[table]
+            start = np.searchsorted(sorted_codes, code, side="left")
+            end = np.searchsorted(sorted_codes, code, side="right")
+            found.append(self.order[table, start:end])
+        return np.unique(np.concatenate(found))
+
+    def similar_items(
+        self,
+        itemid: int,
+        N: int = 10,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """``N`` most similar users of user ``itemid``, itself included.
+
+        Named after implicit's method so that both backends can be used
+        through `knn_index.similar_users`.
+        """
+        users = self.candidates(itemid)
+        query = self.vectors[itemid].toarray().ravel()
+        sims = self.vectors[users] @ query
+        # like the exact similarity matrix, users without overlap are not
+        # neighbours
+        related = (sims > 0) | (users == itemid)
+        users, sims = users[related], sims[related]
+        # the user itself comes first, as with implicit
+        keys = np.where(users == itemid, np.inf, sims)
+        best = np.argsort(-keys, kind="stable")[:N]
+        return users[best], sims[best].astype(np.float64)
@@ -1,21 +1,233 @@
-from typing import List
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
 
+from service.api.models.artifacts import MANIFEST_FILE
 from service.api.models.base_model import BaseModel
-from service.api.models.knn_model import knn_model
+from service.api.models.knn_model import (
+    KNN_MODEL_PATHS,
+    KNNModel,
+    load_knn_model,
+)
+from service.api.models.reco_cache import CachedModel, RecoCache
+from service.api.models.reco_store import RecoStore, RecoStoreModel
 from service.api.models.test_model import test_model
+from service.log import app_logger
+from service.metrics import observe_model_load
+
+# built with `python -m service.api.models.reco_store`
+RECO_STORE_PATH = "service/api/models/files/reco_store"
+
+
+class ModelSource:
+    """Builds a model and names the files it is built from.
+
+    ``loader`` is called with the `ModelsBase` the model is loaded into,
+    so that it can refer to other models, which must be listed in
+    ``requires``. ``paths`` are only used to notice that the model has
+    to be reloaded, missing ones are skipped.
+    """
+
+    def __init__(
+        self,
+        loader: Callable[["ModelsBase"], BaseModel],
+        paths: Sequence[str] = (),
+        requires: Sequence[str] = (),
+    ):
+        self.loader = loader
+        self.paths = paths
+        self.requires = requires
+
+    def load(self, models: "ModelsBase") -> BaseModel:
+        return self.loader(models)
+
+    def mtime(self) -> float:
+        mtimes = [
+            os.path.getmtime(path)
+            for path in self.paths
+            if os.path.exists(path)
+        ]
+        return max(mtimes, default=0.0)
+
+
+class ModelSlot:
+    """A loaded model version and the number of requests using it."""
+
+    def __init__(self, model: BaseModel, version: int):
+        self.model = model
+        self.version = version
+        self.in_flight = 0
+        self.retired = False
+        self.drained = threading.Event()
+
+    def wait_drained(self, timeout: Optional[float] = None) -> bool:
+        return self.drained.wait(timeout)
 
 
 class ModelsBase:
-    def __init__(self, models: List[BaseModel]):
-        self.models = {m.model_name: m for m in models}
+    """Registry of the served models.
+
+    Models are built from their sources on first use or by `load_all`,
+    whichever comes first.
+    """
+
+    def __init__(
+        self,
+        sources: Dict[str, ModelSource],
+        cache: Optional[RecoCache] = None,
+    ):
+        self.sources = sources
+        self.cache = cache
+        self.slots: Dict[str, ModelSlot] = {}
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in sources}
 
     def check_model(self, model_name: str) -> bool:
-        return self.models.get(model_name) is not None
+        return model_name in self.sources or model_name in self.slots
+
+    def is_loaded(self, model_name: str) -> bool:
+        return model_name in self.slots
+
+    def load_model(self, model_name: str) -> BaseModel:
+        """Build ``model_name`` from its source unless already loaded."""
+        with self._load_locks[model_name]:
+            slot = self.slots.get(model_name)
+            if slot is not None:
+                return slot.model
+            start = time.perf_counter()
+            model = self.sources[model_name].load(self)
+            self.set_model(model)
+        duration = time.perf_counter() - start
+        app_logger.info(f"Model {model_name} loaded in {duration:.2f}s")
+        observe_model_load(model_name, "load", duration)
+        return model
+
+    def load_all(self) -> None:
+        for model_name in self.sources:
+            self.load_model(model_name)
+
+    def get_model(self, model_name: str) -> BaseModel:
+        slot = self.slots.get(model_name)
+        return self.load_model(model_name) if slot is None else slot.model
+
+    def set_model(self, model: BaseModel) -> Tuple[int, Optional[ModelSlot]]:
+        """Register ``model``, replacing the one with the same name.
+
+        Every call bumps the model version, so cached recommendations
+        of the replaced model are never served again. Returns the new
+        version and the replaced slot, if any.
+        """
+        name = model.model_name
+        with self._lock:
+            old_slot = self.slots.get(name)
+            version = 1 if old_slot is None else old_slot.version + 1
+            self.slots[name] = ModelSlot(model, version)
+            if old_slot is not None:
+                old_slot.retired = True
+                if old_slot.in_flight == 0:
+                    old_slot.drained.set()
+        if self.cache is not None:
+            self.cache.invalidate(name)
+        return version, old_slot
+
+    def set_cache(self, cache: Optional[RecoCache]) -> None:
+        self.cache = cache
+
+    def _wrap(self, slot: ModelSlot) -> BaseModel:
+        # lightweight models are cheaper to call than to cache
+        if slot.model.lightweight or self.cache is None:
+            return slot.model
+        return CachedModel(slot.model, self.cache, slot.version)
+
+    def init_model(self, model_name: str) -> Optional[BaseModel]:
+        if not self.check_model(model_name):
+            return None
+        self.get_model(model_name)
+        return self._wrap(self.slots[model_name])
+
+    @contextmanager
+    def acquire(self, model_name: str) -> Iterator[BaseModel]:
+        """Hold the current version of ``model_name`` for one request.
+
+        A version replaced in the meantime is released once its last
+        holder exits.
+        """
+        self.get_model(model_name)
+        with self._lock:
+            slot = self.slots[model_name]
+            slot.in_flight += 1
+        try:
+            yield self._wrap(slot)
+        finally:
+            with self._lock:
+                slot.in_flight -= 1
+                if slot.retired and slot.in_flight == 0:
+                    slot.drained.set()
+
+
+class ModelRef(BaseModel):
+    """Calls the current version of a model registered in `ModelsBase`."""
+
+    def __init__(self, models: ModelsBase, model_name: str):
+        super().__init__(model_name)
+        self.models = models
+
+    def predict(self, user_id: int, k: int) -> List[int]:
+        return self.models.init_model(self.model_name).predict(user_id, k)
+
+    def predict_batch(self, user_ids: List[int], k: int) -> List[List[int]]:
+        model = self.models.init_model(self.model_name)
+        return model.predict_batch(user_ids, k)
+
+
+def load_reco_store_model(models: ModelsBase) -> RecoStoreModel:
+    knn_name = KNNModel.model_name
+
+    def complete(user_id: int, recs: List[int], k: int) -> List[int]:
+        # like KNNModel does it, with its current version, so that the
+        # replaced ones are released
+        knn_model = models.get_model(knn_name)
+        segment = knn_model.user_segment_map.get(user_id)
+        return knn_model.popular.complete(recs, k, segment)
+
+    return RecoStoreModel(
+        store=RecoStore.load(RECO_STORE_PATH),
+        fallback=ModelRef(models, knn_name),
+        complete=complete,
+    )
 
-    def init_model(self, model_name: str) -> BaseModel:
-        return self.models.get(model_name)
 
+# every model the service knows how to build,
+# ServiceConfig.models_config picks the ones to serve
+MODEL_SOURCES: Dict[str, ModelSource] = {
+    test_model.model_name: ModelSource(lambda _: test_model),
+    KNNModel.model_name: ModelSource(
+        lambda _: load_knn_model(), KNN_MODEL_PATHS
+    ),
+    RecoStoreModel.model_name: ModelSource(
+        load_reco_store_model,
+        [os.path.join(RECO_STORE_PATH, MANIFEST_FILE)],
+        requires=[KNNModel.model_name],
+    ),
+}
 
-AVAILABLE_MODELS = [test_model, knn_model]
 
-models_base = ModelsBase(AVAILABLE_MODELS)
+def create_models_base(
+    model_names: Sequence[str],
+    cache: Optional[RecoCache] = None,
+) -> ModelsBase:
+    unknown = set(model_names) - set(MODEL_SOURCES)
+    if unknown:
+        raise ValueError(f"Unknown models: {sorted(unknown)}")
+    for name in model_names:
+        missing = set(MODEL_SOURCES[name].requires) - set(model_names)
+        if missing:
+            raise ValueError(
+                f"Model {name} requires models that are not enabled: "
+                f"{sorted(missing)}"
+            )
+    return ModelsBase(
+        {name: MODEL_SOURCES[name] for name in model_names}, cache=cache
+    )
@@ -0,0 +1,86 @@
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+# popular items kept per segment, longer lists fall back to global ones
+SEGMENT_POPULAR_SIZE = 1000
+
+
+class PopularItems:
+    """Popular items for unknown users and for short recommendation lists.
+
+    Holds a global ranking and optional per-segment ones. Rankings are
+    converted to lists once, so answering a cold user is a slice of a
+    prebuilt list.
+    """
+
+    def __init__(
+        self,
+        items: Sequence[int],
+        segment_items: Optional[Dict[int, Sequence[int]]] = None,
+    ):
+        self.items = np.asarray(items)
+        self.segment_items = {
+            segment: np.asarray(ranking)
+            for segment, ranking in (segment_items or {}).items()
+        }
+        self._global = self.items.tolist()
+        self._segments = {
+            segment: ranking.tolist()
+            for segment, ranking in self.segment_items.items()
+        }
+
+    @classmethod
+    def from_segment_models(
+        cls,
+        items: Sequence[int],
+        segment_model_map: Dict[int, Any],
+        size: int = SEGMENT_POPULAR_SIZE,
+    ) -> "PopularItems":
+        """Rank items of every segment by the number of its users who
+        watched them, read from the watched-items index of its model.
+        """
+        segment_items = {}
+        for segment, model in segment_model_map.items():
+            counts = np.bincount(
+                model.watched_indices, minlength=len(model.items_inv_array)
+            )
+            order = np.argsort(-counts, kind="stable")[:size]
+            order = order[counts[order] > 0]
+            segment_items[segment] = model.items_inv_array[order]
+        return cls(items, segment_items)
+
+    def array(self, segment: Optional[int] = None) -> np.ndarray:
+        """Ranking of ``segment`` or the global one, without a copy."""
+        return self.segment_items.get(segment, self.items)
+
+    def recommend(self, k: int, segment: Optional[int] = None) -> List[int]:
+        ranking = self._segments.get(segment, self._global)
+        if len(ranking) < k and ranking is not self._global:
+            return self.complete(ranking[:k], k)
+        return ranking[:k]
+
+    def complete(
+        self,
+        recs: List[int],
+        k: int,
+        segment: Optional[int] = None,
+    ) -> List[int]:
+        """Fill ``recs`` up to ``k`` with popular items of ``segment``,
+        then global ones, skipping items already in ``recs``.
+        """
+        if len(recs) >= k:
+            return recs[:k]
+        recs = list(recs)
+        seen = set(recs)
+        rankings = [self._global]
+        if segment in self._segments:
+            rankings.insert(0, self._segments[segment])
+        for ranking in rankings:
+            for item in ranking:
+                if item not in seen:
+                    recs.append(item)
+                    seen.add(item)
+                    if len(recs) == k:
+                        return recs
+        return recs
@@ -0,0 +1,162 @@
+import threading
+import time
+import typing as tp
+from collections import OrderedDict
+
+import numpy as np
+
+from service.api.models.base_model import BaseModel
+from service.metrics import cache_lookups
+
+CacheKey = tp.Tuple[str, int, int]
+
+# rough per-entry cost of the key, the entry tuple and the array header
+ENTRY_OVERHEAD = 256
+
+
+class RecoCache:
+    """Bounded LRU cache of model recommendations.
+
+    Entries are keyed by ``(model_name, model_version, user_id)`` and hold
+    the recommendations for the largest ``k`` requested so far, smaller
+    requests are answered with a prefix. Items are kept as int32 arrays,
+    their total size is bounded by ``max_bytes``; entries older than
+    ``ttl`` seconds are treated as missing.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20, ttl: float = 600.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._lookups = cache_lookups()
+
+        self._entries: tp.OrderedDict[
+            CacheKey, tp.Tuple[np.ndarray, int, float]
+        ] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        model_name: str,
+        model_version: int,
+        user_id: int,
+        k: int,
+    ) -> tp.Optional[tp.List[int]]:
+        key = (model_name, model_version, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.monotonic():
+                self._pop(key)
+                entry = None
+            if entry is None or entry[1] < k:
+                self.misses += 1
+                if self._lookups:
+                    self._lookups[1].inc()
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if self._lookups:
+                self._lookups[0].inc()
+        return entry[0][:k].tolist()
+
+    def set(
+        self,
+        model_name: str,
+        model_version: int,
+        user_id: int,
+        k: int,
+        items: tp.List[int],
+    ) -> None:
+        if self.max_bytes <= 0 or self.ttl <= 0:
+            return
+        key = (model_name, model_version, user_id)
+        array = np.asarray(items, dtype=np.int32)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > k:
+                    return
+                self._pop(key)
+            self._entries[key] = (array, k, time.monotonic() + self.ttl)
+            self.nbytes += array.nbytes + ENTRY_OVERHEAD
+            while self.nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key: CacheKey) -> None:
+        array = self._entries.pop(key)[0]
+        self.nbytes -= array.nbytes + ENTRY_OVERHEAD
+
+    def invalidate(self, model_name: str) -> None:
+        """Drop every cached version of ``model_name``."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == model_name]:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self) -> tp.Dict[str, float]:
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / requests if requests else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.nbytes,
+        }
+
+
+class CachedModel(BaseModel):
+    """Answers from ``cache`` first and calls ``model`` on misses."""
+
+    def __init__(self, model: BaseModel, cache: RecoCache, model_version: int):
+        super().__init__(model.model_name)
+        self.model = model
+        self.cache = cache
+        self.model_version = model_version
+        self.lightweight = model.lightweight
+
+    def is_cold(self, user_id: int) -> bool:
+        return self.model.is_cold(user_id)
+
+    def predict(self, user_id: int, k: int) -> tp.List[int]:
+        if self.model.is_cold(user_id):
+            return self.model.predict(user_id, k)
+        recs = self.cache.get(self.model_name, self.model_version, user_id, k)
+        if recs is None:
+            recs = self.model.predict(user_id, k)
+            self.cache.set(
+                self.model_name, self.model_version, user_id, k, recs
+            )
+        return recs
+
+    def predict_batch(
+        self,
+        user_ids: tp.List[int],
+        k: int,
+    ) -> tp.List[tp.List[int]]:
+        recos = [
+            None
+            if self.model.is_cold(user_id)
+            else self.cache.get(
+                self.model_name, self.model_version, user_id, k
+            )
+            for user_id in user_ids
+        ]
+        missing = [i for i, recs in enumerate(recos) if recs is None]
+        if missing:
+            predicted = self.model.predict_batch(
+                [user_ids[i] for i in missing], k
+            )
+            for i, recs in zip(missing, predicted):
+                recos[i] = recs
+                if self.model.is_cold(user_ids[i]):
+                    continue
+                self.cache.set(
+                    self.model_name, self.model_version, user_ids[i], k, recs
+                )
+        return recos
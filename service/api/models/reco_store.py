@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from service.api.models.artifacts import (
+    MANIFEST_FILE,
+    new_version,
+    read_version,
+    switch_version,
+)
+from service.api.models.base_model import BaseModel
+from service.api.models.knn_model import rank_segment
+from service.log import app_logger
+
+USER_IDS_FILE = "user_ids.npy"
+ITEMS_FILE = "items.npy"
+# users ranked at once, bounds the memory of a build
+BUILD_CHUNK_SIZE = 10_000
+
+
+class RecoStore:
+    """Top-K recommendations of known users kept in flat arrays.
+
+    ``user_ids`` is sorted and serves as the id -> row index,
+    ``items`` holds one int32 row of item ids per user padded with -1.
+    """
+
+    def __init__(self, user_ids: np.ndarray, items: np.ndarray):
+        self.user_ids = user_ids
+        self.items = items
+
+    @property
+    def k(self) -> int:
+        return self.items.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def get(self, user_id: int) -> Optional[np.ndarray]:
+        row = np.searchsorted(self.user_ids, user_id)
+        if row == len(self.user_ids) or self.user_ids[row] != user_id:
+            return None
+        return self.items[row]
+
+    def save(self, path: str) -> None:
+        """Write the arrays to a new version directory of ``path`` and
+        switch its manifest to them, like `export_artifacts`, so that
+        workers mapping the previous store keep reading consistent files.
+        """
+        os.makedirs(path, exist_ok=True)
+        previous = read_version(path)
+        version = new_version(path)
+        manifest = {"version": version}
+        for key, filename, array in (
+            ("user_ids", USER_IDS_FILE, self.user_ids),
+            ("items", ITEMS_FILE, self.items),
+        ):
+            manifest[key] = os.path.join(version, filename)
+            np.save(os.path.join(path, manifest[key]), array)
+        switch_version(path, manifest, previous)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "RecoStore":
+        mmap_mode = "r" if mmap else None
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        else:
+            # stores saved before versioning keep the files in ``path``
+            manifest = {"user_ids": USER_IDS_FILE, "items": ITEMS_FILE}
+        return cls(
+            user_ids=np.load(
+                os.path.join(path, manifest["user_ids"]), mmap_mode=mmap_mode
+            ),
+            items=np.load(
+                os.path.join(path, manifest["items"]), mmap_mode=mmap_mode
+            ),
+        )
+
+
+def build_reco_store(
+    user_segment_map: Dict[int, int],
+    segment_model_map: Dict[int, Any],
+    k: int,
+    chunk_size: int = BUILD_CHUNK_SIZE,
+) -> RecoStore:
+    """Rank the top-``k`` items of every known user from the neighbour
+    table of its segment model.
+
+    Works with fitted `UserKnn` models as well as with the `KNNSegment`
+    views of exported artifacts.
+    """
+    segments = pd.Series(user_segment_map, dtype=np.int64)
+    user_ids = np.sort(segments.index.to_numpy(dtype=np.int64))
+    items = np.full((len(user_ids), k), -1, dtype=np.int32)
+
+    for segment, segment_users in segments.groupby(segments.values):
+        model = segment_model_map.get(segment)
+        if model is None:
+            continue
+        known = segment_users.index.isin(model.users_inv_array)
+        users = segment_users.index[known]
+        if len(users) == 0:
+            continue
+        app_logger.info(f"Building recommendations of segment {segment}")
+        for start in range(0, len(users), chunk_size):
+            end = start + chunk_size
+            chunk = users[start:end]
+            ranked = rank_segment(
+                model, [model.users_mapping[user] for user in chunk], k
+            )
+            rows = np.searchsorted(user_ids, chunk.to_numpy(np.int64))
+            for row, user_items in zip(rows, ranked):
+                items[row, : len(user_items)] = model.items_inv_array[
+                    user_items
+                ]
+
+    return RecoStore(user_ids, items)
+
+
+class RecoStoreModel(BaseModel):
+    """Serves precomputed recommendations, other users go to ``fallback``.
+
+    Known users cost a binary search and an array slice, but unknown
+    users and requests for more than ``store.k`` items run the fallback
+    model, so that the model is called in the prediction executor.
+    Short rows are filled up by ``complete``, called with the user id,
+    the row and ``k``.
+    """
+
+    model_name = "knn_store_model"
+
+    def __init__(
+        self,
+        store: RecoStore,
+        fallback: BaseModel,
+        complete: Callable[[int, List[int], int], List[int]],
+    ):
+        super().__init__(self.model_name)
+        self.store = store
+        self.fallback = fallback
+        self.complete = complete
+
+    def _from_store(self, user_id: int, k: int) -> Optional[List[int]]:
+        row = self.store.get(user_id)
+        if row is None or k > self.store.k:
+            return None
+        recs = row[:k]
+        recs = recs[recs >= 0].tolist()
+        if len(recs) == k:
+            return recs
+        return self.complete(user_id, recs, k)
+
+    def predict(self, user_id: int, k: int) -> List[int]:
+        recs = self._from_store(user_id, k)
+        if recs is None:
+            return self.fallback.predict(user_id, k)
+        return recs
+
+    def predict_batch(self, user_ids: List[int], k: int) -> List[List[int]]:
+        recos = [self._from_store(user_id, k) for user_id in user_ids]
+        missing = [i for i, recs in enumerate(recos) if recs is None]
+        if missing:
+            predicted = self.fallback.predict_batch(
+                [user_ids[i] for i in missing], k
+            )
+            for i, recs in zip(missing, predicted):
+                recos[i] = recs
+        return recos
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Precompute kNN recommendations of known users."
+    )
+    parser.add_argument("output", help="directory to write the store to")
+    parser.add_argument("--k", type=int, default=50)
+    args = parser.parse_args()
+
+    # pylint: disable=import-outside-toplevel
+    from service.api.models.knn_model import load_knn_model
+
+    knn_model = load_knn_model()
+    store = build_reco_store(
+        knn_model.user_segment_map, knn_model.segment_model_map, args.k
+    )
+    store.save(args.output)
+    app_logger.info(f"Saved {len(store)} users to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
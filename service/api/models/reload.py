@@ -0,0 +1,146 @@
+import numbers
+import threading
+import time
+import typing as tp
+
+from service.api.models.base_model import BaseModel
+from service.log import app_logger
+from service.metrics import observe_model_load
+
+if tp.TYPE_CHECKING:
+    from service.api.models.models_base import ModelsBase
+
+
+class ModelCheckError(Exception):
+    pass
+
+
+def check_model(model: BaseModel, user_ids: tp.Sequence[int], k: int) -> None:
+    """Smoke check a freshly loaded model before it takes traffic."""
+    for user_id in user_ids:
+        recs = model.predict(user_id, k)
+        if len(recs) != k or not all(
+            isinstance(r, numbers.Integral) for r in recs
+        ):
+            raise ModelCheckError(
+                f"Model {model.model_name} returned {recs!r} "
+                f"for user {user_id}"
+            )
+
+
+class ModelReloader:
+    """Loads new model versions in the background and swaps them in.
+
+    A model is loaded and checked on a separate thread while the current
+    version keeps serving, then replaces it in ``models_base`` at once.
+    The old version is dropped after the requests holding it finish.
+
+    Reloads are local to the process: under gunicorn every worker has to
+    be told, which `watch` does by polling the model files.
+    """
+
+    def __init__(
+        self,
+        models_base: "ModelsBase",
+        check_users: tp.Sequence[int] = (0,),
+        check_k: int = 10,
+        drain_timeout: float = 30.0,
+    ):
+        self.models_base = models_base
+        self.check_users = check_users
+        self.check_k = check_k
+        self.drain_timeout = drain_timeout
+        self.status: tp.Dict[str, tp.Dict[str, tp.Any]] = {}
+
+        self._running: tp.Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def reload(self, model_name: str) -> int:
+        """Load, check and swap in a new version of ``model_name``."""
+        source = self.models_base.sources[model_name]
+        start = time.perf_counter()
+        model = source.load(self.models_base)
+        check_model(model, self.check_users, self.check_k)
+        version, old_slot = self.models_base.set_model(model)
+        duration = time.perf_counter() - start
+        app_logger.info(
+            f"Model {model_name} version {version} loaded in {duration:.2f}s"
+        )
+        observe_model_load(model_name, "reload", duration)
+
+        if old_slot is not None:
+            if old_slot.wait_drained(self.drain_timeout):
+                app_logger.info(
+                    f"Model {model_name} version {old_slot.version} released"
+                )
+            else:
+                app_logger.warning(
+                    f"Model {model_name} version {old_slot.version} "
+                    f"still in use after {self.drain_timeout}s"
+                )
+        return version
+
+    def _run(self, model_name: str) -> None:
+        self.status[model_name] = {"state": "loading"}
+        try:
+            version = self.reload(model_name)
+        except Exception as e:  # pylint: disable=broad-except
+            app_logger.exception(f"Model {model_name} reload failed")
+            self.status[model_name] = {"state": "failed", "error": str(e)}
+        else:
+            self.status[model_name] = {"state": "ready", "version": version}
+        finally:
+            with self._lock:
+                self._running.discard(model_name)
+
+    def start_reload(self, model_name: str) -> bool:
+        """Reload ``model_name`` on a background thread.
+
+        Returns False if a reload of this model is already running.
+        """
+        with self._lock:
+            if model_name in self._running:
+                return False
+            self._running.add(model_name)
+        threading.Thread(
+            target=self._run,
+            args=(model_name,),
+            name=f"reload-{model_name}",
+            daemon=True,
+        ).start()
+        return True
+
+    def watch(self, interval: float) -> None:
+        """Reload models whose files change, checking every ``interval``."""
+        sources = self.models_base.sources
+        mtimes = {name: source.mtime() for name, source in sources.items()}
+
+        deferred: tp.Set[str] = set()
+
+        def poll() -> None:
+            while not self._stop.wait(interval):
+                for name, source in sources.items():
+                    mtime = source.mtime()
+                    if mtime == mtimes[name]:
+                        continue
+                    # models not used yet will be built from the new files
+                    if self.models_base.is_loaded(name):
+                        if not self.start_reload(name):
+                            # the files are seen again once it finishes
+                            if name not in deferred:
+                                deferred.add(name)
+                                app_logger.info(
+                                    f"Model {name} files changed during "
+                                    "a reload, reloading after it"
+                                )
+                            continue
+                        app_logger.info(f"Model {name} files changed")
+                    deferred.discard(name)
+                    mtimes[name] = mtime
+
+        self._stop.clear()
+        threading.Thread(target=poll, name="reload-watch", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,85 @@
+from typing import List, Tuple
+
+import numpy as np
+
+DEDUP_METHODS = ("first", "max")
+
+
+def score_candidates(
+    items: np.ndarray,
+    sims: np.ndarray,
+    idf: np.ndarray,
+    dedup: str = "first",
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Score candidate items of similar users.
+
+    ``items`` are inner item ids ordered by neighbour, ``sims`` their
+    neighbour similarities. Every item is kept once, with the similarity
+    of its first neighbour (``dedup="first"``) or of its most similar
+    one (``dedup="max"``), and scored as ``sim * idf``. Items come back
+    in order of first appearance.
+    """
+    unique, first, inverse = np.unique(
+        items, return_index=True, return_inverse=True
+    )
+    if dedup == "first":
+        best = sims[first]
+    elif dedup == "max":
+        best = np.full(len(unique), -np.inf)
+        np.maximum.at(best, inverse, sims)
+    else:
+        raise ValueError(f"Unknown dedup method: {dedup}")
+    order = np.argsort(first, kind="stable")
+    unique = unique[order]
+    return unique, best[order] * idf[unique]
+
+
+def top_k(items: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """``k`` best items by score; ties keep their original order."""
+    if k <= 0:
+        return items[:0]
+    if len(scores) > k:
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(len(scores))
+    order = np.argsort(-scores[candidates], kind="stable")[:k]
+    return items[candidates[order]]
+
+
+def rank_batch(
+    owners: np.ndarray,
+    items: np.ndarray,
+    sims: np.ndarray,
+    idf: np.ndarray,
+    n_rows: int,
+    k: int,
+    dedup: str = "first",
+) -> List[np.ndarray]:
+    """`score_candidates` and `top_k` for many users in one pass.
+
+    ``owners`` tells which of ``n_rows`` users each candidate belongs
+    to; per user, candidates are ordered by neighbour as in the single
+    user case and results match it exactly.
+    """
+    positions = np.arange(len(items))
+    # one candidate per (user, item): its first or most similar neighbour
+    if dedup == "first":
+        order = np.lexsort((positions, items, owners))
+    elif dedup == "max":
+        order = np.lexsort((positions, -sims, items, owners))
+    else:
+        raise ValueError(f"Unknown dedup method: {dedup}")
+    owners, items = owners[order], items[order]
+    keep = np.ones(len(order), dtype=bool)
+    keep[1:] = (owners[1:] != owners[:-1]) | (items[1:] != items[:-1])
+    owners, items, order = owners[keep], items[keep], order[keep]
+    scores = sims[order] * idf[items]
+
+    # best k per user, ties in order of first appearance
+    order = np.lexsort((positions[order], -scores, owners))
+    owners, items = owners[order], items[order]
+    starts = np.searchsorted(owners, np.arange(n_rows))
+    ranks = np.arange(len(owners)) - starts[owners]
+    owners, items = owners[ranks < k], items[ranks < k]
+    return np.split(items, np.searchsorted(owners, np.arange(1, n_rows)))
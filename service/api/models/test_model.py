@@ -6,6 +6,7 @@ from service.log import app_logger
 
 class TestModel(BaseModel):
     model_name = "test_model"
+    lightweight = True
 
     def __init__(self):
         super().__init__(self.model_name)
@@ -1,3 +1,10 @@
+import hashlib
+import os
+import threading
+import time
+import typing as tp
+from collections import OrderedDict
+
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
@@ -16,27 +23,141 @@ class BotRequest(BaseModel):
     k_recs: int
 
 
-def check_token(token: str) -> bool:
-    return pwd_context.verify(token, AVAILABLE_HASH)
+class TokenCache:
+    """Bounded LRU cache of bearer token verification results.
+
+    Tokens are stored as keyed blake2b digests, never in plain text.
+    Successful verifications live for ``ttl`` seconds, failed ones for
+    ``negative_ttl`` seconds. The whole cache is dropped as soon as it is
+    queried with a hash other than the one it was filled with.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 300.0,
+        negative_ttl: float = 5.0,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+
+        self._key = os.urandom(16)
+        self._hash: tp.Optional[str] = None
+        self._entries: tp.OrderedDict[bytes, tp.Tuple[bool, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def _digest(self, token: str) -> bytes:
+        return hashlib.blake2b(
+            token.encode("utf-8"), key=self._key, digest_size=16
+        ).digest()
+
+    def get(self, token: str, hashed: str) -> tp.Optional[bool]:
+        key = self._digest(token)
+        with self._lock:
+            if hashed != self._hash:
+                self._entries.clear()
+                self._hash = hashed
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token: str, hashed: str, verified: bool) -> None:
+        ttl = self.ttl if verified else self.negative_ttl
+        if self.maxsize <= 0 or ttl <= 0:
+            return
+        key = self._digest(token)
+        with self._lock:
+            if hashed != self._hash:
+                self._entries.clear()
+                self._hash = hashed
+            self._entries[key] = (verified, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> tp.Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+        }
+
+
+def check_token(token: str, cache: tp.Optional[TokenCache] = None) -> bool:
+    if cache is None:
+        return pwd_context.verify(token, AVAILABLE_HASH)
+
+    hashed = AVAILABLE_HASH
+    verified = cache.get(token, hashed)
+    if verified is None:
+        verified = pwd_context.verify(token, hashed)
+        cache.set(token, hashed, verified)
+    return verified
 
 
 async def get_k_items(request: Request) -> int:
     return request.app.state.k_recs
 
 
-async def get_bot_request(
-    model_name: str,
-    user_id: int,
-    k_items: int = Depends(get_k_items),
+async def get_token_cache(request: Request) -> TokenCache:
+    return request.app.state.token_cache
+
+
+async def verify_token(
     token: str = Depends(oauth2_scheme),
-) -> BotRequest:
-    verified = check_token(token)
+    token_cache: TokenCache = Depends(get_token_cache),
+) -> None:
+    verified = check_token(token, token_cache)
     if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate token",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+def verify_admin_token(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+) -> None:
+    """Admits the holder of the admin token, a client token is not enough.
+
+    Admin calls are rare, so the token is not cached, and the dependency
+    is sync so that FastAPI runs the slow bcrypt check in its threadpool.
+    """
+    hashed = request.app.state.admin_token_hash
+    if hashed is None:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin routes are disabled",
+        )
+    if not pwd_context.verify(token, hashed):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def get_bot_request(
+    model_name: str,
+    user_id: int,
+    k_items: int = Depends(get_k_items),
+    _: None = Depends(verify_token),
+) -> BotRequest:
     bot_request = BotRequest(
         model_name=model_name, user_id=user_id, k_recs=k_items
     )
@@ -1,16 +1,39 @@
-from typing import Dict, List
-
-from fastapi import APIRouter, Depends, FastAPI, status
-from pydantic import BaseModel
-
-from service.api.exceptions import ModelNotFoundError, UserNotFoundError
-from service.api.models.models_base import models_base
-from service.api.secure_token import BotRequest, get_bot_request
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, FastAPI, Request, status
+from prometheus_client import CONTENT_TYPE_LATEST
+from pydantic import BaseModel, PositiveInt
+from starlette.responses import Response
+
+from service.api.exceptions import (
+    BatchTooLargeError,
+    ModelNotFoundError,
+    ReloadInProgressError,
+    TooManyItemsError,
+    UserNotFoundError,
+)
+from service.api.executor import PredictionExecutor, get_executor
+from service.api.models.base_model import BaseModel as RecoModel
+from service.api.models.models_base import ModelsBase
+from service.api.models.reload import ModelReloader
+from service.api.secure_token import (
+    BotRequest,
+    get_bot_request,
+    get_k_items,
+    verify_admin_token,
+    verify_token,
+)
 from service.log import app_logger
+from service.metrics import render_metrics
+from service.response import ORJSONResponse
 
 responses: Dict = {
     404: {"description": "Model or user not found."},
     401: {"description": "Not authenticated. Wrong token."},
+    409: {"description": "Model is already being reloaded."},
+    413: {"description": "Too many users in one batch request."},
+    503: {"description": "Too many requests in progress."},
 }
 
 
@@ -19,7 +42,63 @@ class RecoResponse(BaseModel):
     items: List[int]
 
 
+class BatchRecoRequest(BaseModel):
+    user_ids: List[int]
+    k: Optional[PositiveInt] = None
+
+
+class BatchRecoResponse(BaseModel):
+    recos: List[RecoResponse]
+
+
+class ModelInfo(BaseModel):
+    model_name: str
+    loaded: bool
+    version: Optional[int] = None
+    in_flight: int = 0
+    reload: Dict = {}
+
+
+class ReloadResponse(BaseModel):
+    model_name: str
+    state: str
+
+
+# ids above it are never known to the models
+MAX_USER_ID = 10**9
+
 router = APIRouter()
+metrics_router = APIRouter()
+
+
+def model_not_found(model_name: str) -> ModelNotFoundError:
+    return ModelNotFoundError(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Model {model_name} not found",
+    )
+
+
+async def get_models(request: Request) -> ModelsBase:
+    return request.app.state.models
+
+
+@asynccontextmanager
+async def use_model(
+    models: ModelsBase,
+    model_name: str,
+    executor: PredictionExecutor,
+) -> AsyncIterator[RecoModel]:
+    if not models.check_model(model_name):
+        raise model_not_found(model_name)
+    if not models.is_loaded(model_name):
+        # the first request of a model loads it off the event loop
+        await executor.run(models.load_model, model_name)
+    with models.acquire(model_name) as model:
+        yield model
+
+
+async def get_reloader(request: Request) -> ModelReloader:
+    return request.app.state.reloader
 
 
 @router.get(
@@ -38,27 +117,133 @@ async def health() -> str:
 )
 async def get_reco(
     bot_request: BotRequest = Depends(get_bot_request),
-) -> RecoResponse:
+    models: ModelsBase = Depends(get_models),
+    executor: PredictionExecutor = Depends(get_executor),
+) -> ORJSONResponse:
     msg = (
         f"Request for model: {bot_request.model_name}, "
         + f'error_message=f"User {bot_request.user_id} not found'
     )
     app_logger.info(msg)
 
-    if bot_request.user_id > 10**9:
+    if bot_request.user_id > MAX_USER_ID:
         raise UserNotFoundError()
 
-    if models_base.check_model(bot_request.model_name):
-        model = models_base.init_model(bot_request.model_name)
-    else:
-        raise ModelNotFoundError(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Model {bot_request.model_name} not found",
-        )
+    async with use_model(models, bot_request.model_name, executor) as model:
+        if model.lightweight or model.is_cold(bot_request.user_id):
+            reco = model.predict(bot_request.user_id, bot_request.k_recs)
+        else:
+            reco = await executor.run(
+                model.predict, bot_request.user_id, bot_request.k_recs
+            )
+    # the model returns plain ints, RecoResponse only documents them
+    return ORJSONResponse({"user_id": bot_request.user_id, "items": reco})
+
+
+@router.post(
+    path="/reco/{model_name}/batch",
+    tags=["Recommendations"],
+    response_model=BatchRecoResponse,
+    responses=responses,
+    dependencies=[Depends(verify_token)],
+)
+async def get_reco_batch(
+    request: Request,
+    model_name: str,
+    batch_request: BatchRecoRequest,
+    k_items: int = Depends(get_k_items),
+    models: ModelsBase = Depends(get_models),
+    executor: PredictionExecutor = Depends(get_executor),
+) -> ORJSONResponse:
+    user_ids = batch_request.user_ids
+    k_recs = batch_request.k or k_items
+    app_logger.info(
+        f"Batch request for model: {model_name}, users: {len(user_ids)}"
+    )
+
+    if len(user_ids) > request.app.state.max_batch_size:
+        raise BatchTooLargeError()
+    if k_recs > request.app.state.max_k_recs:
+        raise TooManyItemsError()
+    # the rule of get_reco, a single unknown id fails the whole batch
+    if any(user_id > MAX_USER_ID for user_id in user_ids):
+        raise UserNotFoundError()
 
-    reco = model.predict(bot_request.user_id, bot_request.k_recs)
-    return RecoResponse(user_id=bot_request.user_id, items=reco)
+    async with use_model(models, model_name, executor) as model:
+        if model.lightweight:
+            recos = model.predict_batch(user_ids, k_recs)
+        else:
+            recos = await executor.run(model.predict_batch, user_ids, k_recs)
+    return ORJSONResponse(
+        {
+            "recos": [
+                {"user_id": user_id, "items": reco}
+                for user_id, reco in zip(user_ids, recos)
+            ]
+        }
+    )
+
+
+@router.get(
+    path="/admin/models",
+    tags=["Admin"],
+    response_model=List[ModelInfo],
+    dependencies=[Depends(verify_admin_token)],
+)
+async def get_models_info(
+    models: ModelsBase = Depends(get_models),
+    reloader: ModelReloader = Depends(get_reloader),
+) -> List[ModelInfo]:
+    infos = []
+    for model_name in models.sources:
+        slot = models.slots.get(model_name)
+        info = ModelInfo(
+            model_name=model_name,
+            loaded=slot is not None,
+            reload=reloader.status.get(model_name, {}),
+        )
+        if slot is not None:
+            info.version = slot.version
+            info.in_flight = slot.in_flight
+        infos.append(info)
+    return infos
+
+
+@router.post(
+    path="/admin/models/{model_name}/reload",
+    tags=["Admin"],
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=ReloadResponse,
+    responses=responses,
+    dependencies=[Depends(verify_admin_token)],
+)
+async def reload_model(
+    model_name: str,
+    reloader: ModelReloader = Depends(get_reloader),
+) -> ReloadResponse:
+    """Load a new version of the model in the background of this process.
+
+    The current version keeps serving until the new one passes its check.
+    """
+    if model_name not in reloader.models_base.sources:
+        raise model_not_found(model_name)
+    if not reloader.start_reload(model_name):
+        raise ReloadInProgressError()
+    app_logger.info(f"Reload of model {model_name} started")
+    return ReloadResponse(model_name=model_name, state="loading")
+
+
+@metrics_router.get(
+    path="/metrics",
+    tags=["Health"],
+    response_class=Response,
+)
+async def metrics() -> Response:
+    """Service metrics in the Prometheus text format."""
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 
 def add_views(app: FastAPI) -> None:
     app.include_router(router)
+    if app.state.config.metrics_config.enabled:
+        app.include_router(metrics_router)
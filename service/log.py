@@ -1,4 +1,7 @@
+import atexit
 import logging.config
+import logging.handlers
+import queue
 import typing as tp
 
 from .settings import ServiceConfig
@@ -6,6 +9,9 @@ from .settings import ServiceConfig
 app_logger = logging.getLogger("app")
 access_logger = logging.getLogger("access")
 
+# loggers written to on every request, their records go through the queue
+QUEUED_LOGGERS = (app_logger, access_logger)
+
 
 class ServiceNameFilter(logging.Filter):
     def __init__(self, name: str = "", service_name: str = "") -> None:
@@ -139,6 +145,130 @@ def get_config(service_config: ServiceConfig) -> tp.Dict[str, tp.Any]:
     return config
 
 
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Puts records in a bounded queue without ever waiting.
+
+    When the queue is full either the new record or the oldest queued
+    one is dropped, and counted in ``dropped``.
+    """
+
+    def __init__(self, records: queue.Queue, drop: str = "new") -> None:
+        super().__init__(records)
+        self.drop = drop
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            self.dropped += 1
+        if self.drop == "old":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+
+
+class RoutingHandler(logging.Handler):
+    """Hands queued records to the handlers of the logger they came from."""
+
+    def __init__(self, routes: tp.Dict[str, tp.List[logging.Handler]]):
+        super().__init__()
+        self.routes = routes
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        for handler in self.routes.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+
+class QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # wait for room in a full queue instead of failing to stop
+        self.queue.put(self._sentinel)
+
+
+class QueuedLogging:
+    """Moves the handlers of ``loggers`` behind one bounded queue, served
+    by a listener thread.
+    """
+
+    def __init__(
+        self,
+        loggers: tp.Sequence[logging.Logger],
+        size: int,
+        drop: str = "new",
+    ) -> None:
+        self.size = size
+        self.handler = DroppingQueueHandler(queue.Queue(size), drop)
+        routes = {}
+        for logger in loggers:
+            routes[logger.name] = logger.handlers[:]
+            for handler in routes[logger.name]:
+                logger.removeHandler(handler)
+            logger.addHandler(self.handler)
+        self.listener = QueueListener(
+            self.handler.queue, RoutingHandler(routes)
+        )
+
+    @property
+    def dropped(self) -> int:
+        return self.handler.dropped
+
+    def start(self) -> None:
+        self.listener.start()
+
+    def stop(self) -> None:
+        """Write the queued records and stop the listener."""
+        if self.listener._thread is not None:  # pylint: disable=W0212
+            self.listener.stop()
+
+    def restart(self) -> None:
+        """Start afresh in a forked child, whose copy of the queue may be
+        locked by the parent's listener and has no thread serving it.
+        """
+        self.handler.queue = queue.Queue(self.size)
+        self.listener.queue = self.handler.queue
+        self.listener._thread = None  # pylint: disable=W0212
+        self.start()
+
+
+_queued: tp.Optional[QueuedLogging] = None
+
+
+def dropped_records() -> int:
+    """Records dropped since logging was set up because the queue was
+    full.
+    """
+    return _queued.dropped if _queued is not None else 0
+
+
+def reset_logging_after_fork() -> None:
+    if _queued is not None:
+        _queued.restart()
+
+
+def _stop_queued() -> None:
+    global _queued  # pylint: disable=W0603
+    if _queued is not None:
+        _queued.stop()
+        _queued = None
+
+
 def setup_logging(service_config: ServiceConfig) -> None:
+    global _queued  # pylint: disable=W0603
+    _stop_queued()
     config = get_config(service_config)
     logging.config.dictConfig(config)
+    log_config = service_config.log_config
+    if log_config.queue_enabled:
+        _queued = QueuedLogging(
+            QUEUED_LOGGERS, log_config.queue_size, log_config.queue_drop
+        )
+        _queued.start()
+
+
+atexit.register(_stop_queued)
@@ -0,0 +1,33 @@
+import typing as tp
+
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Private_Clean": "uss",
+    "Private_Dirty": "uss",
+}
+
+
+def get_memory_usage(pid: tp.Union[int, str] = "self") -> tp.Dict[str, int]:
+    """Resident, proportional and unique set sizes of a process in bytes.
+
+    Unique size (uss) is what the process does not share with others,
+    i.e. what killing it would free. Empty on systems without
+    ``/proc/<pid>/smaps_rollup``.
+    """
+    usage = dict.fromkeys(SMAPS_FIELDS.values(), 0)
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                field, _, value = line.partition(":")
+                if field in SMAPS_FIELDS:
+                    usage[SMAPS_FIELDS[field]] += int(value.split()[0]) * 1024
+    except OSError:
+        return {}
+    return usage
+
+
+def format_memory_usage(usage: tp.Dict[str, int]) -> str:
+    return " ".join(
+        f"{name}={value / 2 ** 20:.1f}MiB" for name, value in usage.items()
+    )
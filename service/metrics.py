@@ -0,0 +1,129 @@
+import os
+import time
+import typing as tp
+
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from .settings import MetricsConfig
+
+# Under gunicorn every worker writes its values to files in this
+# directory and any of them serves the sum, see gunicorn.config.py.
+# It is read by prometheus_client when imported.
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+_multiproc_dir = os.environ.get(MULTIPROC_DIR_ENV)
+if _multiproc_dir:
+    os.makedirs(_multiproc_dir, exist_ok=True)
+
+# stages of KNNModel.predict
+STAGES = ("segment_lookup", "similar_items", "scoring", "popular_backfill")
+
+REQUEST_BUCKETS = (1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 1, 5)
+STAGE_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 5e-3, 0.05)
+LOAD_BUCKETS = (0.1, 1, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_DURATION = Histogram(
+    "reco_request_duration_seconds",
+    "Duration of HTTP requests.",
+    ["model_name", "status"],
+    buckets=REQUEST_BUCKETS,
+)
+STAGE_DURATION = Histogram(
+    "reco_model_stage_duration_seconds",
+    "Duration of the stages of a model prediction.",
+    ["model_name", "stage"],
+    buckets=STAGE_BUCKETS,
+)
+MODEL_LOAD_DURATION = Histogram(
+    "reco_model_load_duration_seconds",
+    "Duration of model loads and reloads.",
+    ["model_name", "kind"],
+    buckets=LOAD_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "reco_cache_lookups",
+    "Recommendation cache lookups by result.",
+    ["result"],
+)
+EXECUTOR_PENDING = Gauge(
+    "reco_executor_pending",
+    "Model calls running or waiting in the prediction executor.",
+    multiprocess_mode="livesum",
+)
+
+_enabled = False
+
+
+def setup_metrics(config: MetricsConfig) -> None:
+    global _enabled  # pylint: disable=W0603
+    _enabled = config.enabled
+
+
+class StageTimer:
+    """Observes how long the stages of a model prediction take.
+
+    Callers keep the time a stage started and pass it to `lap`, which
+    returns the time the next one starts. Models hold ``None`` instead
+    of a timer when metrics are disabled, so that timing a stage costs
+    them a truth test.
+    """
+
+    def __init__(self, model_name: str):
+        self._stages = {
+            stage: STAGE_DURATION.labels(model_name, stage)
+            for stage in STAGES
+        }
+
+    def lap(self, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        self._stages[stage].observe(now - start)
+        return now
+
+
+def stage_timer(model_name: str) -> tp.Optional[StageTimer]:
+    return StageTimer(model_name) if _enabled else None
+
+
+def cache_lookups() -> tp.Optional[tp.Tuple[Counter, Counter]]:
+    """Counters of cache hits and misses, if metrics are enabled."""
+    if not _enabled:
+        return None
+    return CACHE_LOOKUPS.labels("hit"), CACHE_LOOKUPS.labels("miss")
+
+
+def executor_pending() -> tp.Optional[Gauge]:
+    return EXECUTOR_PENDING if _enabled else None
+
+
+def observe_request(model_name: str, status: int, duration: float) -> None:
+    REQUEST_DURATION.labels(model_name, str(status)).observe(duration)
+
+
+def observe_model_load(model_name: str, kind: str, duration: float) -> None:
+    if _enabled:
+        MODEL_LOAD_DURATION.labels(model_name, kind).observe(duration)
+
+
+def render_metrics() -> bytes:
+    """Metrics in the Prometheus text format, summed over all workers in
+    multiprocess mode.
+    """
+    if not os.environ.get(MULTIPROC_DIR_ENV):
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop the live gauges of an exited worker."""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(pid)
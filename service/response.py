@@ -1,4 +1,3 @@
-import json
 import typing as tp
 from http import HTTPStatus
 
@@ -9,29 +8,29 @@ from pydantic import BaseModel
 from service.models import Error
 
 
-class EnhancedJSONEncoder(json.JSONEncoder):
-    def default(self, o: tp.Any) -> tp.Any:
-        if isinstance(o, BaseModel):
-            return o.dict()
-        try:
-            orjson.dumps(o)
-        except TypeError:
-            return str(o)
-        return super().default(o)
+def _default(o: tp.Any) -> tp.Any:
+    if isinstance(o, BaseModel):
+        return o.dict()
+    return str(o)
 
 
-class DataclassJSONResponse(JSONResponse):
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson.
+
+    Content is sent as is, without validation against a response model:
+    views return it directly for trusted lists of item ids. Numpy arrays
+    and scalars are serialised natively, pydantic models as dicts and
+    anything else orjson does not know as a string.
+    """
+
     media_type = "application/json"
 
     def render(self, content: tp.Any) -> bytes:
-        return json.dumps(
+        return orjson.dumps(
             content,
-            ensure_ascii=False,
-            allow_nan=False,
-            indent=None,
-            separators=(",", ":"),
-            cls=EnhancedJSONEncoder,
-        ).encode("utf-8")
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        )
 
 
 def create_response(
@@ -51,7 +50,7 @@ def create_response(
     if errors is not None:
         content["errors"] = errors
 
-    return DataclassJSONResponse(content, status_code=status_code)
+    return ORJSONResponse(content, status_code=status_code)
 
 
 def server_error(errors: tp.List[Error]) -> JSONResponse:
@@ -1,3 +1,5 @@
+from typing import List, Literal, Optional
+
 from pydantic import BaseSettings
 
 
@@ -9,22 +11,121 @@ class Config(BaseSettings):
 class LogConfig(Config):
     level: str = "INFO"
     datetime_format: str = "%Y-%m-%d %H:%M:%S"
+    # write app and access records from a thread, off the event loop
+    queue_enabled: bool = True
+    queue_size: int = 10000
+    # records dropped when the queue is full: the "new" or the "old" ones
+    queue_drop: Literal["new", "old"] = "new"
+    # share of access records written, slow or failed requests always are
+    access_sample_rate: float = 1.0
+    access_slow_threshold: float = 1.0
 
     class Config:
         case_sensitive = False
         fields = {
             "level": {"env": ["log_level"]},
+            "queue_enabled": {"env": ["log_queue_enabled"]},
+            "queue_size": {"env": ["log_queue_size"]},
+            "queue_drop": {"env": ["log_queue_drop"]},
+            "access_sample_rate": {"env": ["log_access_sample_rate"]},
+            "access_slow_threshold": {"env": ["log_access_slow_threshold"]},
         }
 
 
+class SecurityConfig(Config):
+    # bcrypt hash of the token of the admin routes, which are disabled
+    # without it
+    admin_token_hash: Optional[str] = None
+    token_cache_size: int = 1024
+    token_cache_ttl: float = 300.0
+    token_cache_negative_ttl: float = 5.0
+
+
+class ExecutorConfig(Config):
+    max_workers: int = 4
+    queue_size: int = 32
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "executor_"
+
+
+class RecoCacheConfig(Config):
+    enabled: bool = True
+    max_mb: float = 64.0
+    ttl: float = 600.0
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "reco_cache_"
+
+
+class ModelsConfig(Config):
+    # names from service.api.models.models_base.MODEL_SOURCES, along
+    # with the models they require
+    enabled: List[str] = ["test_model", "knn_model"]
+    # load every enabled model at startup instead of on first request
+    preload: bool = False
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "models_"
+
+
+class ReloadConfig(Config):
+    # seconds between checks of the model files, 0 disables watching
+    watch_interval: float = 0.0
+    drain_timeout: float = 30.0
+    check_users: List[int] = [0]
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "reload_"
+
+
+class CORSConfig(Config):
+    # internal deployments without browser clients can turn CORS off
+    enabled: bool = True
+    allow_origins: List[str] = ["*"]
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "cors_"
+
+
+class MetricsConfig(Config):
+    enabled: bool = True
+
+    class Config:
+        case_sensitive = False
+        env_prefix = "metrics_"
+
+
 class ServiceConfig(Config):
     service_name: str = "reco_service"
     k_recs: int = 10
+    max_batch_size: int = 1000
+    # upper bound of k in batch requests
+    max_k_recs: int = 100
 
     log_config: LogConfig
+    security_config: SecurityConfig
+    executor_config: ExecutorConfig
+    models_config: ModelsConfig
+    reco_cache_config: RecoCacheConfig
+    reload_config: ReloadConfig
+    cors_config: CORSConfig
+    metrics_config: MetricsConfig
 
 
 def get_config() -> ServiceConfig:
     return ServiceConfig(
         log_config=LogConfig(),
+        security_config=SecurityConfig(),
+        executor_config=ExecutorConfig(),
+        models_config=ModelsConfig(),
+        reco_cache_config=RecoCacheConfig(),
+        reload_config=ReloadConfig(),
+        cors_config=CORSConfig(),
+        metrics_config=MetricsConfig(),
     )
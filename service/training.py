@@ -0,0 +1,206 @@
+import argparse
+import os
+import typing as tp
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    wait,
+)
+
+import dill
+import numpy as np
+import pandas as pd
+from implicit.nearest_neighbours import CosineRecommender, ItemItemRecommender
+
+from service.api.models.lsh_index import LSHIndex
+from service.log import app_logger
+from userknn import ITEM_WEIGHTINGS, UserKnn
+
+USERS_SEGMENT_MAP_FILE = "users_segment_map.dill"
+SEGMENT_MODEL_MAP_FILE = "segment_model_map.dill"
+
+
+def fit_segment(
+    segment: int,
+    train: pd.DataFrame,
+    n_users: int,
+    recommender: tp.Type[tp.Union[ItemItemRecommender, LSHIndex]],
+    recommender_params: tp.Dict[str, tp.Any],
+    weighting: str = "idf",
+) -> tp.Tuple[int, UserKnn]:
+    model = UserKnn(
+        recommender(**recommender_params), N_users=n_users, weighting=weighting
+    )
+    model.fit(train)
+    return segment, model
+
+
+def split_segments(
+    interactions: pd.DataFrame,
+    users_segment: pd.Series,
+) -> tp.Iterator[tp.Tuple[int, pd.DataFrame]]:
+    """Yield the interactions of every segment, largest segments first.
+
+    Only the columns `UserKnn.fit` reads are kept.
+    """
+    train = interactions[["user_id", "item_id"]]
+    segments = train["user_id"].map(users_segment)
+    sizes = segments.value_counts()
+    groups = train.groupby(segments, sort=False).indices
+    for segment in sizes.index:
+        yield int(segment), train.iloc[groups[segment]]
+
+
+def train_segments(
+    interactions: pd.DataFrame,
+    users_segment: pd.Series,
+    n_users: int = 50,
+    recommender: tp.Type[ItemItemRecommender] = CosineRecommender,
+    recommender_params: tp.Optional[tp.Dict[str, tp.Any]] = None,
+    max_workers: tp.Optional[int] = None,
+    weighting: str = "idf",
+    lsh_min_users: tp.Optional[int] = None,
+    lsh_params: tp.Optional[tp.Dict[str, tp.Any]] = None,
+) -> tp.Tuple[tp.Dict[int, int], tp.Dict[int, UserKnn]]:
+    """Fit a `UserKnn` per segment in a process pool.
+
+    ``users_segment`` maps user ids to segments. Returns the
+    ``users_segment_map`` and ``segment_model_map`` the service loads;
+    users of segments too small to fit a model are left out of both.
+
+    At most ``max_workers`` segments are handed to the pool at a time,
+    so that a worker only ever holds the interactions of one segment.
+    Every model is fitted with ``num_threads=1`` unless given, the
+    parallelism comes from the pool.
+
+    Segments of at least ``lsh_min_users`` users find neighbours with an
+    approximate `LSHIndex` built with ``lsh_params``, as the exact
+    similarity matrix grows quadratically with the segment size.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    params = {"num_threads": 1, **(recommender_params or {})}
+    users_segment = users_segment.dropna().astype(np.int64)
+    train_users = users_segment.index.isin(interactions["user_id"].unique())
+    users_segment = users_segment[train_users]
+
+    segment_model_map: tp.Dict[int, UserKnn] = {}
+
+    def collect(futures: tp.Set[Future]) -> None:
+        for future in futures:
+            segment, model = future.result()
+            segment_model_map[segment] = model
+            app_logger.info(
+                f"Segment {segment} fitted on "
+                f"{len(model.users_inv_array)} users"
+            )
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending: tp.Set[Future] = set()
+        for segment, train in split_segments(interactions, users_segment):
+            # the notebook skips segments with a single interaction
+            if len(train) <= 1:
+                continue
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            segment_recommender, segment_params = recommender, params
+            if (
+                lsh_min_users is not None
+                and train["user_id"].nunique() >= lsh_min_users
+            ):
+                segment_recommender = LSHIndex
+                # enough candidates for the neighbour table
+                segment_params = {"K": n_users, **(lsh_params or {})}
+            pending.add(
+                pool.submit(
+                    fit_segment,
+                    segment,
+                    train,
+                    n_users,
+                    segment_recommender,
+                    segment_params or {},
+                    weighting,
+                )
+            )
+        collect(pending)
+
+    users_segment = users_segment[users_segment.isin(segment_model_map)]
+    return users_segment.to_dict(), segment_model_map
+
+
+def save_models(
+    path: str,
+    users_segment_map: tp.Dict[int, int],
+    segment_model_map: tp.Dict[int, UserKnn],
+) -> None:
+    os.makedirs(path, exist_ok=True)
+    files = [
+        (os.path.join(path, USERS_SEGMENT_MAP_FILE), users_segment_map),
+        (os.path.join(path, SEGMENT_MODEL_MAP_FILE), segment_model_map),
+    ]
+    for filename, obj in files:
+        with open(f"{filename}.tmp", "wb") as f:
+            dill.dump(obj, f)
+    # a running service watching the files never reads half of one
+    for filename, _ in files:
+        os.replace(f"{filename}.tmp", filename)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Fit segment kNN models in parallel."
+    )
+    parser.add_argument("interactions", help="csv with user_id, item_id")
+    parser.add_argument("users_segment", help="csv with user_id, segment")
+    parser.add_argument("output", help="directory to write models to")
+    parser.add_argument("--segment-col", default="segm")
+    parser.add_argument("--n-users", type=int, default=50)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--weighting", choices=sorted(ITEM_WEIGHTINGS), default="idf"
+    )
+    parser.add_argument(
+        "--lsh-min-users",
+        type=int,
+        default=None,
+        help=(
+            "use approximate neighbours in segments this large; they fit "
+            "no faster than exact ones at a usable recall, see "
+            "benchmarks/neighbours.py"
+        ),
+    )
+    # 32 tables of 4 bits find about 0.96-0.99 of the exact neighbours,
+    # more bits fit faster but lose most of them
+    parser.add_argument("--lsh-tables", type=int, default=32)
+    parser.add_argument("--lsh-bits", type=int, default=4)
+    args = parser.parse_args()
+
+    interactions = pd.read_csv(
+        args.interactions, usecols=["user_id", "item_id"]
+    )
+    users_segment = pd.read_csv(
+        args.users_segment,
+        usecols=["user_id", args.segment_col],
+        index_col="user_id",
+    )[args.segment_col]
+
+    users_segment_map, segment_model_map = train_segments(
+        interactions,
+        users_segment,
+        n_users=args.n_users,
+        recommender_params={"K": args.k},
+        max_workers=args.workers,
+        weighting=args.weighting,
+        lsh_min_users=args.lsh_min_users,
+        lsh_params={"n_tables": args.lsh_tables, "n_bits": args.lsh_bits},
+    )
+    save_models(args.output, users_segment_map, segment_model_map)
+    app_logger.info(
+        f"Saved {len(segment_model_map)} segment models to {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
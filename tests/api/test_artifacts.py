@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from service.api.models.artifacts import export_artifacts, load_artifacts
+from service.api.models.knn_model import KNNModel
+from userknn import UserKnn
+
+
+def test_artifacts_round_trip(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    tmp_path: Path,
+) -> None:
+    users = interactions["user_id"].unique()
+    user_segment_map = {user_id: 0 for user_id in users}
+    pop_items = interactions["item_id"].value_counts().index.to_numpy()
+    export_artifacts(
+        str(tmp_path), user_segment_map, {0: fitted_knn}, pop_items
+    )
+
+    loaded_segments, loaded_models, loaded_pop = load_artifacts(str(tmp_path))
+    assert isinstance(loaded_models[0].watched_indices, np.memmap)
+    assert dict(loaded_segments) == user_segment_map
+    np.testing.assert_array_equal(loaded_pop, pop_items)
+
+    model = KNNModel(user_segment_map, {0: fitted_knn}, pop_items.tolist())
+    loaded = KNNModel(loaded_segments, loaded_models, loaded_pop)
+    for user_id in list(users) + [-1]:
+        assert loaded.predict(user_id, 10) == model.predict(user_id, 10)
+
+
+def test_export_does_not_rewrite_mapped_arrays(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    tmp_path: Path,
+) -> None:
+    user_segment_map = {user_id: 0 for user_id in interactions["user_id"]}
+    export_artifacts(
+        str(tmp_path), user_segment_map, {0: fitted_knn}, np.arange(5)
+    )
+    _, _, mapped_pop = load_artifacts(str(tmp_path))
+
+    for pop_items in (np.arange(5, 10), np.arange(10, 15)):
+        export_artifacts(
+            str(tmp_path), user_segment_map, {0: fitted_knn}, pop_items
+        )
+
+    np.testing.assert_array_equal(mapped_pop, np.arange(5))
+    np.testing.assert_array_equal(
+        load_artifacts(str(tmp_path))[2], np.arange(10, 15)
+    )
+    # the current version and the previous one
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 2
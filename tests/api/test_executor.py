@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from concurrent.futures.thread import ThreadPoolExecutor
+
+import pytest
+
+from service.api.exceptions import ServiceOverloadedError
+from service.api.executor import PredictionExecutor
+
+
+def test_executor_rejects_when_full() -> None:
+    release = threading.Event()
+    executor = PredictionExecutor(
+        ThreadPoolExecutor(max_workers=1), max_workers=1, queue_size=1
+    )
+
+    async def scenario() -> None:
+        busy = [
+            asyncio.ensure_future(executor.run(release.wait))
+            for _ in range(executor.capacity)
+        ]
+        await asyncio.sleep(0)
+        assert executor.pending == executor.capacity
+        with pytest.raises(ServiceOverloadedError):
+            await executor.run(sum, [1, 2])
+
+        release.set()
+        await asyncio.gather(*busy)
+        assert executor.pending == 0
+        assert await executor.run(sum, [1, 2]) == 3
+
+    try:
+        asyncio.new_event_loop().run_until_complete(scenario())
+    finally:
+        release.set()
+        executor.executor.shutdown()
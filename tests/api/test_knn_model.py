@@ -0,0 +1,61 @@
+# pylint: disable=redefined-outer-name
+import typing as tp
+
+import pandas as pd
+import pytest
+
+from service.api.models.knn_model import KNNModel
+from userknn import UserKnn
+
+
+def make_knn_model(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    **kwargs: tp.Any,
+) -> KNNModel:
+    users = interactions["user_id"].unique()
+    pop_items = interactions["item_id"].value_counts().index.tolist()
+    return KNNModel(
+        user_segment_map={user_id: 0 for user_id in users},
+        segment_model_map={0: fitted_knn},
+        pop_items=pop_items,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("dedup", ["first", "max"])
+@pytest.mark.parametrize("k", [5, 30])
+def test_numpy_scoring_matches_pandas(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    dedup: str,
+    k: int,
+) -> None:
+    numpy_model = make_knn_model(interactions, fitted_knn, dedup=dedup)
+    pandas_model = make_knn_model(
+        interactions, fitted_knn, scoring="pandas", dedup=dedup
+    )
+    for user_id in interactions["user_id"].unique():
+        recs = numpy_model.predict(user_id, k)
+        assert recs == pandas_model.predict(user_id, k)
+        assert len(recs) == len(set(recs)) == k
+
+
+def test_unknown_user_gets_popular(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    model = make_knn_model(interactions, fitted_knn)
+    assert model.predict(-1, 5) == model.pop_items[:5]
+
+
+@pytest.mark.parametrize("dedup", ["first", "max"])
+def test_predict_batch_matches_predict(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    dedup: str,
+) -> None:
+    model = make_knn_model(interactions, fitted_knn, dedup=dedup)
+    user_ids = interactions["user_id"].unique().tolist() + [-1]
+    recos = model.predict_batch(user_ids, 10)
+    assert recos == [model.predict(user_id, 10) for user_id in user_ids]
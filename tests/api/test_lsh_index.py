@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+import pytest
+from implicit.nearest_neighbours import CosineRecommender, TFIDFRecommender
+
+from service.api.models.knn_index import neighbour_table, similar_users
+from service.api.models.knn_model import KNNModel
+from service.api.models.lsh_index import LSHIndex
+from userknn import UserKnn
+
+
+@pytest.mark.parametrize(
+    "weighting,recommender",
+    [("cosine", CosineRecommender), ("tfidf", TFIDFRecommender)],
+)
+def test_lsh_finds_exact_neighbours(
+    interactions: pd.DataFrame,
+    weighting: str,
+    recommender: type,
+) -> None:
+    exact = UserKnn(recommender(K=20), N_users=10)
+    exact.fit(interactions)
+    # with a single bit per table every user is nearly always a candidate
+    approx = UserKnn(LSHIndex(n_tables=16, n_bits=1, weighting=weighting), 10)
+    approx.fit(interactions)
+
+    for user in range(len(exact.users_inv_array)):
+        ids, sims = approx.user_knn.similar_items(user, 10)
+        assert ids[0] == user
+        _, exact_sims = similar_users(exact.user_knn, user, 10, np.inf)
+        _, approx_sims = similar_users(approx.user_knn, user, 10, np.inf)
+        np.testing.assert_allclose(approx_sims, exact_sims, atol=1e-5)
+
+
+@pytest.mark.parametrize("n_tables,n_bits", [(4, 4), (16, 1), (8, 12)])
+def test_lsh_neighbour_table_matches_lookups(
+    interactions: pd.DataFrame,
+    n_tables: int,
+    n_bits: int,
+) -> None:
+    model = UserKnn(LSHIndex(n_tables, n_bits), N_users=10)
+    model.fit(interactions)
+    ids, sims = neighbour_table(
+        model.user_knn, len(model.users_inv_array), model.N_users
+    )
+    np.testing.assert_allclose(model.neighbour_sims, sims, atol=1e-5)
+    # ties may be broken apart by rounding
+    assert (model.neighbours == ids).mean() > 0.95
+
+
+def test_lsh_candidates_share_a_bucket(interactions: pd.DataFrame) -> None:
+    model = UserKnn(LSHIndex(n_tables=2, n_bits=8), N_users=10)
+    model.fit(interactions)
+    index = model.user_knn
+    candidates = index.candidates(0)
+    assert 0 in candidates
+    shared = (index.codes[:, candidates] == index.codes[:, [0]]).any(axis=0)
+    assert shared.all()
+    n_shared = (index.codes == index.codes[:, [0]]).any(axis=0).sum()
+    assert len(candidates) == n_shared
+
+
+def test_knn_model_with_lsh(interactions: pd.DataFrame) -> None:
+    segment_model = UserKnn(LSHIndex(n_tables=4, n_bits=4), N_users=10)
+    segment_model.fit(interactions)
+    users = interactions["user_id"].unique()
+    pop_items = interactions["item_id"].value_counts().index.tolist()
+    model = KNNModel({u: 0 for u in users}, {0: segment_model}, pop_items)
+    for user_id in users[:10]:
+        recs = model.predict(user_id, 10)
+        assert len(recs) == 10
+        assert len(set(recs)) == 10
+
+
+def test_partial_fit_with_lsh(interactions: pd.DataFrame) -> None:
+    first = interactions.iloc[: len(interactions) // 2]
+    model = UserKnn(LSHIndex(n_tables=4, n_bits=4), N_users=10)
+    model.fit(first)
+    model.partial_fit(interactions.iloc[len(interactions) // 2:])
+    n_users = interactions["user_id"].nunique()
+    assert model.user_knn.vectors.shape[0] == n_users
+    assert model.neighbours.shape == (n_users, 9)
+
+
+def test_lsh_unknown_weighting() -> None:
+    with pytest.raises(ValueError):
+        LSHIndex(weighting="bm25")
@@ -0,0 +1,75 @@
+import os
+import typing as tp
+
+import pandas as pd
+from fastapi import FastAPI
+from prometheus_client import REGISTRY
+from starlette.testclient import TestClient
+
+from service.api.app import create_app
+from service.metrics import STAGES
+from service.settings import ServiceConfig
+from tests.api.test_knn_model import make_knn_model
+from userknn import UserKnn
+
+GOOD_TOKEN = os.getenv("GOOD_API_TOKEN")
+
+
+def sample(name: str, labels: tp.Dict[str, str]) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def request_count(model_name: str, status: str) -> float:
+    return sample(
+        "reco_request_duration_seconds_count",
+        {"model_name": model_name, "status": status},
+    )
+
+
+def test_requests_are_observed_by_model_and_status(app: FastAPI) -> None:
+    client = TestClient(app)
+    headers = {"Authorization": f"Bearer {GOOD_TOKEN}"}
+    ok = request_count("test_model", "200")
+    unknown = request_count("unknown", "404")
+
+    client.get("/reco/test_model/1", headers=headers)
+    client.get("/reco/no_such_model/1", headers=headers)
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "reco_request_duration_seconds_bucket" in response.text
+    assert request_count("test_model", "200") == ok + 1
+    assert request_count("unknown", "404") == unknown + 1
+
+
+def test_metrics_can_be_disabled(service_config: ServiceConfig) -> None:
+    service_config.metrics_config.enabled = False
+    app = create_app(service_config)
+
+    assert TestClient(app).get("/metrics").status_code == 404
+    assert app.state.executor._gauge is None  # pylint: disable=W0212
+
+
+def test_knn_model_stages_are_observed(
+    app: FastAPI,
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    def counts() -> tp.List[float]:
+        return [
+            sample(
+                "reco_model_stage_duration_seconds_count",
+                {"model_name": "knn_model", "stage": stage},
+            )
+            for stage in STAGES
+        ]
+
+    model = make_knn_model(interactions, fitted_knn)
+    before = counts()
+    model.predict(interactions["user_id"].iloc[0], 5)
+    model.predict(-1, 5)
+
+    # the cold user only has its segment looked up and popular items
+    expected = [2, 1, 1, 2]
+    assert [b - a for a, b in zip(before, counts())] == expected
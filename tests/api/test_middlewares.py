@@ -0,0 +1,64 @@
+import logging
+import typing as tp
+
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from service.api.app import create_app
+from service.log import access_logger
+from service.settings import ServiceConfig
+
+
+class RecordsHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: tp.List[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+
+def test_unhandled_exception_is_logged_as_server_error(app: FastAPI) -> None:
+    def boom() -> None:
+        raise RuntimeError("boom")
+
+    app.add_api_route("/boom", boom)
+    handler = RecordsHandler()
+    access_logger.addHandler(handler)
+    try:
+        response = TestClient(app).get("/boom")
+    finally:
+        access_logger.removeHandler(handler)
+
+    assert response.status_code == 500
+    assert response.json() == {
+        "errors": [
+            {
+                "error_key": "server_error",
+                "error_message": "Internal Server Error",
+                "error_loc": None,
+            }
+        ]
+    }
+    (record,) = handler.records
+    assert record.status_code == 500
+    assert record.method == "GET"
+    assert str(record.requested_url) == "http://testserver/boom"
+    assert record.request_time >= 0
+
+
+def test_cors_can_be_disabled(service_config: ServiceConfig) -> None:
+    headers = {
+        "Origin": "http://example.com",
+        "Access-Control-Request-Method": "GET",
+    }
+    response = TestClient(create_app(service_config)).options(
+        "/health", headers=headers
+    )
+    assert response.headers["access-control-allow-origin"] == "*"
+
+    service_config.cors_config.enabled = False
+    response = TestClient(create_app(service_config)).options(
+        "/health", headers=headers
+    )
+    assert "access-control-allow-origin" not in response.headers
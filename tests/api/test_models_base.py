@@ -0,0 +1,62 @@
+from http import HTTPStatus
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from starlette.testclient import TestClient
+
+from service.api.models import models_base
+from service.api.models.knn_model import KNNModel
+from service.api.models.models_base import (
+    ModelSource,
+    ModelsBase,
+    create_models_base,
+)
+from service.api.models.reco_store import RecoStore
+
+
+def test_models_load_on_first_use(app: FastAPI, client: TestClient) -> None:
+    models = app.state.models
+    with client:
+        assert client.get("/health").status_code == HTTPStatus.OK
+        assert not models.is_loaded("test_model")
+        assert not models.is_loaded("knn_model")
+
+    assert models.init_model("test_model").predict(0, 3) == [0, 1, 2]
+    assert models.is_loaded("test_model")
+    assert not models.is_loaded("knn_model")
+
+
+def test_unknown_models_are_rejected() -> None:
+    with pytest.raises(ValueError):
+        create_models_base(["test_model", "no_such_model"])
+
+
+def test_models_without_their_sources_are_rejected() -> None:
+    with pytest.raises(ValueError, match="knn_model"):
+        create_models_base(["test_model", "knn_store_model"])
+    models = create_models_base(["knn_model", "knn_store_model"])
+    assert models.check_model("knn_store_model")
+
+
+def test_store_model_completes_with_the_current_knn_model(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    RecoStore(np.array([1]), np.array([[7, -1, -1]])).save(str(tmp_path))
+    monkeypatch.setattr(models_base, "RECO_STORE_PATH", str(tmp_path))
+    models = ModelsBase(
+        {
+            "knn_model": ModelSource(lambda _: KNNModel({}, {}, [5, 6])),
+            "knn_store_model": ModelSource(
+                models_base.load_reco_store_model, requires=["knn_model"]
+            ),
+        }
+    )
+    store_model = models.get_model("knn_store_model")
+    assert store_model.predict(1, 3) == [7, 5, 6]
+
+    # a reloaded kNN model takes over the backfill of the store
+    models.set_model(KNNModel({}, {}, [8, 9]))
+    assert store_model.predict(1, 3) == [7, 8, 9]
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+from service.api.models.knn_model import KNNModel
+from service.api.models.popular import PopularItems
+from service.api.models.reco_cache import CachedModel, RecoCache
+from userknn import UserKnn
+
+
+def test_recommend_prefers_segment_ranking() -> None:
+    popular = PopularItems([1, 2, 3, 4, 5], {0: [9, 3]})
+    assert popular.recommend(3) == [1, 2, 3]
+    assert popular.recommend(2, segment=0) == [9, 3]
+    # short segment rankings are completed with global items
+    assert popular.recommend(4, segment=0) == [9, 3, 1, 2]
+    assert popular.recommend(2, segment=7) == [1, 2]
+    assert popular.array(0) is popular.segment_items[0]
+
+
+def test_complete_skips_seen_items() -> None:
+    popular = PopularItems([1, 2, 3, 4, 5], {0: [5, 4]})
+    assert popular.complete([3, 1], 4) == [3, 1, 2, 4]
+    assert popular.complete([3], 4, segment=0) == [3, 5, 4, 1]
+    assert popular.complete([3, 1, 2], 2) == [3, 1]
+    assert popular.complete([3], 10) == [3, 1, 2, 4, 5]
+
+
+def test_segment_ranking_from_model(fitted_knn: UserKnn) -> None:
+    popular = PopularItems.from_segment_models([], {0: fitted_knn}, size=5)
+    counts = np.bincount(fitted_knn.watched_indices)
+    expected = np.argsort(-counts, kind="stable")[:5]
+    np.testing.assert_array_equal(
+        popular.array(0), fitted_knn.items_inv_array[expected]
+    )
+
+
+def test_cold_users_of_known_segment(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    users = interactions["user_id"].unique()
+    pop_items = interactions["item_id"].value_counts().index.tolist()
+    # -2 has a segment but is not in its model
+    model = KNNModel(
+        {**{user_id: 0 for user_id in users}, -2: 0},
+        {0: fitted_knn},
+        pop_items,
+    )
+    assert model.is_cold(-1) and model.is_cold(-2)
+    assert not model.is_cold(users[0])
+    assert model.predict(-1, 5) == pop_items[:5]
+    assert model.predict(-2, 5) == model.popular.array(0)[:5].tolist()
+    assert model.predict_batch([-2, -1], 5) == [
+        model.predict(-2, 5),
+        model.predict(-1, 5),
+    ]
+
+    cache = RecoCache()
+    cached = CachedModel(model, cache, model_version=1)
+    cached.predict(-1, 5)
+    cached.predict_batch([-2, users[0]], 5)
+    assert cache.stats()["entries"] == 1
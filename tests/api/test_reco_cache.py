@@ -0,0 +1,69 @@
+import time
+import typing as tp
+
+import pytest
+
+from service.api.models.base_model import BaseModel
+from service.api.models.models_base import ModelSource, ModelsBase
+from service.api.models.reco_cache import ENTRY_OVERHEAD, RecoCache
+
+
+class CountingModel(BaseModel):
+    def __init__(self, model_name: str = "counting_model", offset: int = 0):
+        super().__init__(model_name)
+        self.offset = offset
+        self.calls = 0
+
+    def predict(self, user_id: int, k: int) -> tp.List[int]:
+        self.calls += 1
+        return [user_id + self.offset + i for i in range(k)]
+
+
+def test_cache_truncates_to_smaller_k() -> None:
+    cache = RecoCache()
+    cache.set("model", 1, 10, 5, [1, 2, 3, 4, 5])
+    assert cache.get("model", 1, 10, 3) == [1, 2, 3]
+    assert cache.get("model", 1, 10, 6) is None
+    assert cache.get("model", 2, 10, 3) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+    assert stats["hit_ratio"] == pytest.approx(1 / 3)
+
+
+def test_cache_is_bounded_and_expires(monkeypatch: pytest.MonkeyPatch) -> None:
+    entry_size = 4 * 10 + ENTRY_OVERHEAD
+    cache = RecoCache(max_bytes=2 * entry_size, ttl=60)
+    for user_id in range(3):
+        cache.set("model", 1, user_id, 10, list(range(10)))
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == 2 * entry_size
+    assert cache.get("model", 1, 0, 10) is None
+    assert cache.get("model", 1, 2, 10) is not None
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 120)
+    assert cache.get("model", 1, 2, 10) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_models_base_caches_and_invalidates_on_reload() -> None:
+    model = CountingModel()
+    models_base = ModelsBase(
+        {model.model_name: ModelSource(lambda _: model)}, cache=RecoCache()
+    )
+
+    cached = models_base.init_model(model.model_name)
+    assert cached.predict(1, 10) == cached.predict(1, 5) + [6, 7, 8, 9, 10]
+    assert cached.predict_batch([1, 2], 10) == [
+        model.predict(1, 10),
+        model.predict(2, 10),
+    ]
+    assert model.calls == 4
+
+    reloaded = CountingModel(offset=100)
+    models_base.set_model(reloaded)
+    assert models_base.cache.stats()["entries"] == 0
+    assert models_base.init_model(model.model_name).predict(1, 2) == [
+        101,
+        102,
+    ]
@@ -0,0 +1,93 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from service.api.models.artifacts import export_artifacts, load_artifacts
+from service.api.models.popular import PopularItems
+from service.api.models.reco_store import (
+    RecoStore,
+    RecoStoreModel,
+    build_reco_store,
+)
+from service.api.models.test_model import test_model
+from userknn import UserKnn
+
+
+def test_reco_store_serves_batch_predictions(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    tmp_path: Path,
+) -> None:
+    users = interactions["user_id"].unique()
+    build_reco_store(
+        {user_id: 0 for user_id in users}, {0: fitted_knn}, k=10
+    ).save(str(tmp_path))
+    store = RecoStore.load(str(tmp_path))
+    assert isinstance(store.items, np.memmap)
+    assert store.items.dtype == np.int32
+
+    model = RecoStoreModel(store, test_model, lambda _, recs, k: recs)
+    expected = fitted_knn.predict(interactions, N_recs=10)
+    for user_id, recs in expected.groupby("user_id"):
+        assert model.predict(user_id, 5) == recs["item_id"].tolist()[:5]
+
+    # unknown users and deeper requests go to the fallback model
+    assert model.predict(-1, 3) == [0, 1, 2]
+    assert model.predict(users[0], 20) == list(range(20))
+    assert model.predict_batch([users[0], -1], 5) == [
+        expected.loc[expected["user_id"] == users[0], "item_id"].tolist()[:5],
+        list(range(5)),
+    ]
+    # the fallbacks are too slow for the event loop
+    assert not model.lightweight
+
+
+def test_reco_store_is_built_from_artifacts(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    tmp_path: Path,
+) -> None:
+    user_segment_map = {user_id: 0 for user_id in interactions["user_id"]}
+    export_artifacts(str(tmp_path), user_segment_map, {0: fitted_knn}, [])
+    loaded_segments, loaded_models, _ = load_artifacts(str(tmp_path))
+
+    expected = build_reco_store(user_segment_map, {0: fitted_knn}, k=10)
+    store = build_reco_store(
+        dict(loaded_segments), loaded_models, k=10, chunk_size=7
+    )
+    np.testing.assert_array_equal(store.user_ids, expected.user_ids)
+    np.testing.assert_array_equal(store.items, expected.items)
+
+
+def test_short_store_rows_are_completed_segment_first() -> None:
+    store = RecoStore(np.array([1, 2]), np.array([[7, -1, -1], [8, 9, 7]]))
+    popular = PopularItems([7, 5, 6], {0: [4, 7]})
+    model = RecoStoreModel(
+        store,
+        test_model,
+        lambda user_id, recs, k: popular.complete(recs, k, {1: 0}[user_id]),
+    )
+
+    assert model.predict(1, 3) == [7, 4, 5]
+    assert model.predict(2, 2) == [8, 9]
+
+
+def test_rebuild_does_not_touch_a_loaded_store(tmp_path: Path) -> None:
+    def make_store(n_users: int, offset: int) -> RecoStore:
+        items = np.arange(n_users * 3, dtype=np.int32).reshape(-1, 3)
+        return RecoStore(np.arange(n_users), items + offset)
+
+    make_store(1000, 0).save(str(tmp_path))
+    loaded = RecoStore.load(str(tmp_path))
+    # a smaller rebuild would truncate files mapped in place
+    for offset in (10, 20):
+        make_store(10, offset).save(str(tmp_path))
+        assert len(RecoStore.load(str(tmp_path))) == 10
+
+    assert len(loaded) == 1000
+    np.testing.assert_array_equal(loaded.items, make_store(1000, 0).items)
+    rebuilt = RecoStore.load(str(tmp_path))
+    assert rebuilt.get(3).tolist() == [29, 30, 31]
+    # only the current and the previous versions are kept
+    assert len([p for p in tmp_path.iterdir() if p.is_dir()]) == 2
@@ -0,0 +1,165 @@
+import os
+import threading
+import time
+import typing as tp
+from http import HTTPStatus
+
+import pytest
+from passlib.context import CryptContext
+from starlette.testclient import TestClient
+
+from service.api.app import create_app
+from service.api.models.base_model import BaseModel
+from service.api.models.models_base import ModelSource, ModelsBase
+from service.api.models.reload import ModelCheckError, ModelReloader
+from service.settings import ServiceConfig
+
+MODEL_NAME = "offset_model"
+ADMIN_TOKEN = "admin_token"
+
+fast_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+class OffsetModel(BaseModel):
+    def __init__(self, offset: int, size: tp.Optional[int] = None):
+        super().__init__(MODEL_NAME)
+        self.offset = offset
+        self.size = size
+
+    def predict(self, user_id: int, k: int) -> tp.List[int]:
+        return [self.offset + i for i in range(self.size or k)]
+
+
+def make_models_base(
+    *models: OffsetModel,
+    paths: tp.Sequence[str] = (),
+) -> ModelsBase:
+    loaded = iter(models)
+    return ModelsBase({MODEL_NAME: ModelSource(lambda _: next(loaded), paths)})
+
+
+def test_reload_swaps_after_check() -> None:
+    models_base = make_models_base(
+        OffsetModel(0), OffsetModel(100), OffsetModel(0, 1)
+    )
+    reloader = ModelReloader(models_base, drain_timeout=0.1)
+
+    with models_base.acquire(MODEL_NAME) as old_model:
+        assert reloader.reload(MODEL_NAME) == 2
+        # requests in flight keep the version they started with
+        assert old_model.predict(0, 2) == [0, 1]
+    assert models_base.init_model(MODEL_NAME).predict(0, 2) == [100, 101]
+
+    # a model failing the smoke check never takes traffic
+    with pytest.raises(ModelCheckError):
+        reloader.reload(MODEL_NAME)
+    assert models_base.slots[MODEL_NAME].version == 2
+
+
+def test_replaced_slot_drains() -> None:
+    models_base = make_models_base(OffsetModel(0))
+    with models_base.acquire(MODEL_NAME):
+        _, old_slot = models_base.set_model(OffsetModel(100))
+        assert not old_slot.wait_drained(0)
+    assert old_slot.wait_drained(0)
+
+
+def test_watch_reloads_changed_files(tmp_path: tp.Any) -> None:
+    path = tmp_path / "model.dill"
+    path.write_bytes(b"")
+    models_base = make_models_base(
+        OffsetModel(0), OffsetModel(100), paths=[str(path)]
+    )
+    models_base.load_all()
+    reloader = ModelReloader(models_base)
+    reloader.watch(interval=0.01)
+    try:
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        for _ in range(100):
+            if reloader.status.get(MODEL_NAME, {}).get("state") == "ready":
+                break
+            time.sleep(0.01)
+    finally:
+        reloader.stop()
+    assert models_base.init_model(MODEL_NAME).predict(0, 1) == [100]
+
+
+def test_watch_reloads_files_changed_during_a_reload(tmp_path: tp.Any) -> None:
+    path = tmp_path / "model.dill"
+    path.write_bytes(b"")
+    loading, release = threading.Event(), threading.Event()
+    offsets = iter((0, 100, 200))
+
+    def load(_: ModelsBase) -> OffsetModel:
+        offset = next(offsets)
+        if offset == 100:
+            loading.set()
+            release.wait(5)
+        return OffsetModel(offset)
+
+    models_base = ModelsBase({MODEL_NAME: ModelSource(load, [str(path)])})
+    models_base.load_all()
+    reloader = ModelReloader(models_base)
+    reloader.watch(interval=0.01)
+    try:
+        os.utime(path, (time.time() + 10, time.time() + 10))
+        assert loading.wait(5)
+        # the files change again while the first reload runs
+        os.utime(path, (time.time() + 20, time.time() + 20))
+        time.sleep(0.05)
+        release.set()
+        for _ in range(500):
+            if models_base.slots[MODEL_NAME].version == 3:
+                break
+            time.sleep(0.01)
+    finally:
+        reloader.stop()
+    assert models_base.init_model(MODEL_NAME).predict(0, 1) == [200]
+
+
+def test_reload_endpoint(service_config: ServiceConfig) -> None:
+    security_config = service_config.security_config
+    security_config.admin_token_hash = fast_context.hash(ADMIN_TOKEN)
+    client = TestClient(create_app(service_config))
+    headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+    with client:
+        response = client.post(
+            "/admin/models/some_model/reload", headers=headers
+        )
+        assert response.status_code == HTTPStatus.NOT_FOUND
+
+        response = client.post(
+            "/admin/models/test_model/reload", headers=headers
+        )
+        assert response.status_code == HTTPStatus.ACCEPTED
+
+        response = client.get("/admin/models", headers=headers)
+        assert response.status_code == HTTPStatus.OK
+        models = {info["model_name"]: info for info in response.json()}
+        assert set(models) == {"test_model", "knn_model"}
+        assert not models["knn_model"]["loaded"]
+
+
+def test_admin_routes_need_the_admin_token(
+    service_config: ServiceConfig,
+) -> None:
+    client_headers = {
+        "Authorization": f"Bearer {os.getenv('GOOD_API_TOKEN')}"
+    }
+    disabled = TestClient(create_app(service_config))
+    assert (
+        disabled.get("/admin/models", headers=client_headers).status_code
+        == HTTPStatus.FORBIDDEN
+    )
+
+    security_config = service_config.security_config
+    security_config.admin_token_hash = fast_context.hash(ADMIN_TOKEN)
+    client = TestClient(create_app(service_config))
+    assert (
+        client.get("/admin/models", headers=client_headers).status_code
+        == HTTPStatus.UNAUTHORIZED
+    )
+    response = client.post(
+        "/admin/models/test_model/reload", headers=client_headers
+    )
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
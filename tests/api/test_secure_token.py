@@ -0,0 +1,68 @@
+import time
+
+import pytest
+from passlib.context import CryptContext
+
+from service.api import secure_token
+from service.api.secure_token import TokenCache, check_token
+
+TOKEN = "some_token"
+OTHER_TOKEN = "other_token"
+
+fast_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4)
+
+
+@pytest.fixture
+def token_hash(monkeypatch: pytest.MonkeyPatch) -> str:
+    hashed = fast_context.hash(TOKEN)
+    monkeypatch.setattr(secure_token, "AVAILABLE_HASH", hashed)
+    return hashed
+
+
+def test_check_token_caches_results(token_hash: str) -> None:
+    cache = TokenCache()
+    assert check_token(TOKEN, cache)
+    assert check_token(TOKEN, cache)
+    assert not check_token(OTHER_TOKEN, cache)
+    assert not check_token(OTHER_TOKEN, cache)
+    assert cache.stats() == {"hits": 2, "misses": 2, "size": 2}
+
+
+def test_check_token_expires_entries(
+    token_hash: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cache = TokenCache(ttl=60, negative_ttl=1)
+    check_token(TOKEN, cache)
+    check_token(OTHER_TOKEN, cache)
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + 10)
+    assert check_token(TOKEN, cache)
+    assert not check_token(OTHER_TOKEN, cache)
+    assert cache.hits == 1
+    assert cache.misses == 3
+
+
+def test_check_token_invalidates_on_hash_rotation(
+    token_hash: str,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cache = TokenCache()
+    assert check_token(TOKEN, cache)
+
+    monkeypatch.setattr(
+        secure_token, "AVAILABLE_HASH", fast_context.hash(OTHER_TOKEN)
+    )
+    assert not check_token(TOKEN, cache)
+    assert check_token(OTHER_TOKEN, cache)
+    assert cache.hits == 0
+
+
+def test_token_cache_is_bounded(token_hash: str) -> None:
+    cache = TokenCache(maxsize=2)
+    for token in ("a", "b", "c"):
+        cache.set(token, token_hash, True)
+    assert cache.stats()["size"] == 2
+    assert cache.get("a", token_hash) is None
+    assert cache.get("c", token_hash)
@@ -7,6 +7,7 @@ from starlette.testclient import TestClient
 from service.settings import ServiceConfig
 
 GET_RECO_PATH = "/reco/{model_name}/{user_id}"
+BATCH_RECO_PATH = "/reco/{model_name}/batch"
 
 
 GOOD_TOKEN = os.getenv("GOOD_API_TOKEN")
@@ -79,3 +80,74 @@ def test_tokens(client: TestClient, var: str, expectation: HTTPStatus) -> None:
         headers = {"Authorization": f"Bearer {var}"}
         response = client.get(path, headers=headers)
     assert response.status_code == expectation
+
+
+def test_get_reco_batch(
+    client: TestClient,
+    service_config: ServiceConfig,
+) -> None:
+    user_ids = [1, 2, 3]
+    path = BATCH_RECO_PATH.format(model_name="test_model")
+    headers = {"Authorization": f"Bearer {GOOD_TOKEN}"}
+    with client:
+        response = client.post(
+            path, json={"user_ids": user_ids}, headers=headers
+        )
+        response_k = client.post(
+            path, json={"user_ids": user_ids, "k": 3}, headers=headers
+        )
+        response_bad_token = client.post(
+            path,
+            json={"user_ids": user_ids},
+            headers={"Authorization": f"Bearer {BAD_TOKEN}"},
+        )
+    assert response.status_code == HTTPStatus.OK
+    recos = response.json()["recos"]
+    assert [reco["user_id"] for reco in recos] == user_ids
+    assert all(len(reco["items"]) == service_config.k_recs for reco in recos)
+    assert all(len(reco["items"]) == 3 for reco in response_k.json()["recos"])
+    assert response_bad_token.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_get_reco_batch_too_large(
+    client: TestClient,
+    service_config: ServiceConfig,
+) -> None:
+    user_ids = list(range(service_config.max_batch_size + 1))
+    path = BATCH_RECO_PATH.format(model_name="test_model")
+    with client:
+        headers = {"Authorization": f"Bearer {GOOD_TOKEN}"}
+        response = client.post(
+            path, json={"user_ids": user_ids}, headers=headers
+        )
+    assert response.status_code == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["errors"][0]["error_key"] == "batch_too_large"
+
+
+@pytest.mark.parametrize(
+    "body,status_code,error_key",
+    (
+        (
+            {"user_ids": [1], "k": 10**9},
+            HTTPStatus.UNPROCESSABLE_ENTITY,
+            "too_many_items",
+        ),
+        (
+            {"user_ids": [1, 10**9 + 1]},
+            HTTPStatus.NOT_FOUND,
+            "user_not_found",
+        ),
+    ),
+)
+def test_get_reco_batch_rejects_what_get_reco_rejects(
+    client: TestClient,
+    body: dict,
+    status_code: HTTPStatus,
+    error_key: str,
+) -> None:
+    path = BATCH_RECO_PATH.format(model_name="test_model")
+    with client:
+        headers = {"Authorization": f"Bearer {GOOD_TOKEN}"}
+        response = client.post(path, json=body, headers=headers)
+    assert response.status_code == status_code
+    assert response.json()["errors"][0]["error_key"] == error_key
@@ -1,10 +1,14 @@
 # pylint: disable=redefined-outer-name
+import numpy as np
+import pandas as pd
 import pytest
 from fastapi import FastAPI
+from implicit.nearest_neighbours import CosineRecommender
 from starlette.testclient import TestClient
 
 from service.api.app import create_app
 from service.settings import ServiceConfig, get_config
+from userknn import UserKnn
 
 
 @pytest.fixture
@@ -23,3 +27,23 @@ def app(
 @pytest.fixture
 def client(app: FastAPI) -> TestClient:
     return TestClient(app=app)
+
+
+@pytest.fixture
+def interactions() -> pd.DataFrame:
+    rng = np.random.default_rng(42)
+    n_users, n_items = 60, 120
+    counts = rng.integers(1, 15, size=n_users)
+    return pd.DataFrame(
+        {
+            "user_id": np.repeat(np.arange(n_users) * 7 + 1000, counts),
+            "item_id": rng.integers(0, n_items, size=counts.sum()) * 3,
+        }
+    )
+
+
+@pytest.fixture
+def fitted_knn(interactions: pd.DataFrame) -> UserKnn:
+    model = UserKnn(CosineRecommender(K=20), N_users=10)
+    model.fit(interactions)
+    return model
@@ -0,0 +1,129 @@
+import logging
+import os
+import queue
+import threading
+import typing as tp
+
+import pytest
+from starlette.testclient import TestClient
+
+from service.api.app import create_app
+from service.log import DroppingQueueHandler, QueuedLogging, access_logger
+from service.settings import ServiceConfig
+
+
+class RecordsHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: tp.List[logging.LogRecord] = []
+        self.threads: tp.Set[str] = set()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+        self.threads.add(threading.current_thread().name)
+
+
+@pytest.fixture
+def logger() -> tp.Iterator[logging.Logger]:
+    logger = logging.getLogger("tests.log")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    yield logger
+    logger.handlers.clear()
+
+
+def make_record(msg: str) -> logging.LogRecord:
+    return logging.LogRecord("tests", logging.INFO, "", 0, msg, None, None)
+
+
+@pytest.mark.parametrize("drop, kept", (("new", "ab"), ("old", "bc")))
+def test_full_queue_drops_records(drop: str, kept: str) -> None:
+    handler = DroppingQueueHandler(queue.Queue(2), drop)
+    for msg in "abc":
+        handler.handle(make_record(msg))
+
+    assert handler.dropped == 1
+    assert [handler.queue.get_nowait().msg for _ in kept] == list(kept)
+
+
+def test_queued_records_reach_logger_handlers(logger: logging.Logger) -> None:
+    target = RecordsHandler()
+    logger.addHandler(target)
+    queued = QueuedLogging([logger], size=10)
+    queued.start()
+    logger.info("hello %s", "world", extra={"status_code": 200})
+    queued.stop()
+
+    (record,) = target.records
+    assert record.getMessage() == "hello world"
+    assert record.status_code == 200
+    assert threading.current_thread().name not in target.threads
+    assert queued.dropped == 0
+
+
+def test_stop_writes_records_of_a_full_queue(logger: logging.Logger) -> None:
+    target = RecordsHandler()
+    logger.addHandler(target)
+    queued = QueuedLogging([logger], size=2)
+    for msg in "abc":
+        logger.info(msg)
+    queued.start()
+    queued.stop()
+
+    assert [r.msg for r in target.records] == ["a", "b"]
+    assert queued.dropped == 1
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_queued_logging_restarts_after_fork(logger: logging.Logger) -> None:
+    target = RecordsHandler()
+    logger.addHandler(target)
+    queued = QueuedLogging([logger], size=10)
+    queued.start()
+    pid = os.fork()
+    if pid == 0:  # pragma: no cover
+        queued.restart()
+        logger.info("child")
+        queued.stop()
+        os._exit(0 if [r.msg for r in target.records] == ["child"] else 1)
+    _, status = os.waitpid(pid, 0)
+    queued.stop()
+
+    assert os.WEXITSTATUS(status) == 0
+    assert not target.records
+
+
+def test_access_log_sampling(service_config: ServiceConfig) -> None:
+    service_config.log_config.access_sample_rate = 0
+    app = create_app(service_config)
+
+    def boom() -> None:
+        raise RuntimeError("boom")
+
+    app.add_api_route("/boom", boom)
+    client = TestClient(app)
+    target = RecordsHandler()
+    access_logger.addHandler(target)
+    try:
+        client.get("/health")
+        client.get("/boom")
+    finally:
+        access_logger.removeHandler(target)
+
+    assert [r.status_code for r in target.records] == [500]
+
+
+def test_slow_requests_are_always_logged(
+    service_config: ServiceConfig,
+) -> None:
+    service_config.log_config.access_sample_rate = 0
+    service_config.log_config.access_slow_threshold = 0
+    client = TestClient(create_app(service_config))
+    target = RecordsHandler()
+    access_logger.addHandler(target)
+    try:
+        client.get("/health")
+    finally:
+        access_logger.removeHandler(target)
+
+    assert [r.status_code for r in target.records] == [200]
@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+import typing as tp
+
+from prometheus_client import REGISTRY
+from prometheus_client.parser import text_string_to_metric_families
+
+from service.metrics import (
+    MULTIPROC_DIR_ENV,
+    StageTimer,
+    setup_metrics,
+    stage_timer,
+)
+from service.settings import MetricsConfig
+
+WORKER = """
+from service.metrics import observe_request
+observe_request("knn_model", 200, 0.01)
+"""
+SCRAPER = """
+import sys
+from service.metrics import render_metrics
+sys.stdout.write(render_metrics().decode())
+"""
+
+
+def stage_count(model_name: str, stage: str) -> float:
+    value = REGISTRY.get_sample_value(
+        "reco_model_stage_duration_seconds_count",
+        {"model_name": model_name, "stage": stage},
+    )
+    return value or 0.0
+
+
+def test_stage_timer_observes_laps() -> None:
+    before = stage_count("timer_model", "scoring")
+    timer = StageTimer("timer_model")
+    start = timer.lap("scoring", 0.0)
+
+    assert start > 0
+    assert stage_count("timer_model", "scoring") == before + 1
+
+
+def test_no_stage_timer_when_disabled() -> None:
+    setup_metrics(MetricsConfig(enabled=False))
+    try:
+        assert stage_timer("timer_model") is None
+    finally:
+        setup_metrics(MetricsConfig())
+    assert isinstance(stage_timer("timer_model"), StageTimer)
+
+
+def run(code: str, env: tp.Dict[str, str]) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+
+
+def test_values_of_processes_are_summed(tmp_path: tp.Any) -> None:
+    env = {**os.environ, MULTIPROC_DIR_ENV: str(tmp_path)}
+    for _ in range(2):
+        run(WORKER, env)
+
+    families = text_string_to_metric_families(run(SCRAPER, env))
+    (requests,) = [
+        family
+        for family in families
+        if family.name == "reco_request_duration_seconds"
+    ]
+    counts = [
+        sample.value
+        for sample in requests.samples
+        if sample.name.endswith("_count")
+        and sample.labels == {"model_name": "knn_model", "status": "200"}
+    ]
+    assert counts == [2.0]
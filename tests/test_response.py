@@ -0,0 +1,38 @@
+import json
+
+import numpy as np
+
+from service.models import Error
+from service.response import ORJSONResponse, create_response
+
+
+def test_create_response_renders_errors() -> None:
+    response = create_response(
+        404,
+        errors=[Error(error_key="user_not_found", error_message="Нет")],
+    )
+    assert response.status_code == 404
+    assert response.headers["content-type"] == "application/json"
+    assert json.loads(response.body) == {
+        "errors": [
+            {
+                "error_key": "user_not_found",
+                "error_message": "Нет",
+                "error_loc": None,
+            }
+        ]
+    }
+
+
+def test_orjson_response_renders_numpy_and_unknown_types() -> None:
+    content = {
+        "items": np.arange(3, dtype=np.int32),
+        "user_id": np.int64(7),
+        1: {1, 2} - {1, 2},
+    }
+    response = ORJSONResponse(content)
+    assert json.loads(response.body) == {
+        "items": [0, 1, 2],
+        "user_id": 7,
+        "1": "set()",
+    }
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import dill
+import numpy as np
+import pandas as pd
+from implicit.nearest_neighbours import CosineRecommender
+
+from service.api.models.lsh_index import LSHIndex
+from service.training import (
+    SEGMENT_MODEL_MAP_FILE,
+    USERS_SEGMENT_MAP_FILE,
+    save_models,
+    train_segments,
+)
+from userknn import UserKnn
+
+
+def test_train_segments_matches_sequential_fit(
+    interactions: pd.DataFrame,
+    tmp_path: Path,
+) -> None:
+    users = interactions["user_id"].unique()
+    users_segment = pd.Series(users % 3, index=users)
+    # a segment without interactions and a user without a segment
+    users_segment[-1] = 3
+    users_segment = users_segment.drop(users[0])
+
+    users_segment_map, segment_model_map = train_segments(
+        interactions,
+        users_segment,
+        n_users=10,
+        recommender_params={"K": 20},
+        max_workers=2,
+    )
+    assert set(segment_model_map) == {0, 1, 2}
+    assert users_segment_map == users_segment.drop(-1).to_dict()
+
+    for segment, model in segment_model_map.items():
+        segment_users = users_segment.index[users_segment == segment]
+        train = interactions[interactions["user_id"].isin(segment_users)]
+        expected = UserKnn(CosineRecommender(K=20), N_users=10)
+        expected.fit(train)
+        pd.testing.assert_frame_equal(
+            model.predict(train), expected.predict(train)
+        )
+
+    save_models(str(tmp_path), users_segment_map, segment_model_map)
+    with open(tmp_path / USERS_SEGMENT_MAP_FILE, "rb") as f:
+        assert dill.load(f) == users_segment_map
+    with open(tmp_path / SEGMENT_MODEL_MAP_FILE, "rb") as f:
+        assert set(dill.load(f)) == {0, 1, 2}
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_train_segments_uses_lsh_for_large_segments(
+    interactions: pd.DataFrame,
+) -> None:
+    users = interactions["user_id"].unique()
+    # 40 users in segment 0 and 20 in segment 1
+    users_segment = pd.Series(
+        np.where(np.arange(len(users)) < 20, 1, 0), index=users
+    )
+    _, segment_model_map = train_segments(
+        interactions,
+        users_segment,
+        n_users=10,
+        max_workers=1,
+        lsh_min_users=30,
+        lsh_params={"n_tables": 2},
+    )
+    assert isinstance(segment_model_map[0].user_knn, LSHIndex)
+    assert segment_model_map[0].user_knn.n_tables == 2
+    assert isinstance(segment_model_map[1].user_knn, CosineRecommender)
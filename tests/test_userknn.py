@@ -0,0 +1,323 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+from implicit.nearest_neighbours import CosineRecommender
+
+from service.api.models.knn_index import (
+    fill_neighbours,
+    similar_users,
+    table_neighbours,
+)
+from userknn import MAPPING_VIEWS, UserKnn
+
+
+def watched_sets(model: UserKnn) -> dict:
+    starts, ends = model.watched_indptr[:-1], model.watched_indptr[1:]
+    return {
+        user: set(
+            model.items_inv_array[
+                model.watched_indices[starts[inner]:ends[inner]]
+            ]
+        )
+        for user, inner in model.users_mapping.items()
+    }
+
+
+def test_watched_index(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    expected = interactions.groupby("user_id")["item_id"].agg(set).to_dict()
+    assert fitted_knn.watched_indptr.dtype == np.int32
+    assert fitted_knn.watched_indices.dtype == np.int32
+    assert watched_sets(fitted_knn) == expected
+
+
+def test_item_idf_array(fitted_knn: UserKnn) -> None:
+    idf = fitted_knn.item_idf.set_index("index")["idf"]
+    assert fitted_knn.item_idf_array.dtype == np.float32
+    np.testing.assert_allclose(
+        fitted_knn.item_idf_array,
+        idf.loc[fitted_knn.items_inv_array].to_numpy(),
+        rtol=1e-6,
+    )
+
+
+def test_legacy_watched_frame_is_converted(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    expected = watched_sets(fitted_knn)
+    state = fitted_knn.__dict__.copy()
+    for key in (
+        "watched_indptr",
+        "watched_indices",
+        "users_inv_array",
+        "items_inv_array",
+        "item_idf_array",
+    ):
+        del state[key]
+    state["watched"] = interactions.groupby("user_id").agg({"item_id": list})
+    # legacy models were pickled with their dict mappings
+    for name in MAPPING_VIEWS:
+        state[name] = getattr(fitted_knn, name)
+
+    # what unpickling a legacy model does
+    restored = UserKnn.__new__(UserKnn)
+    restored.__setstate__(pickle.loads(pickle.dumps(state)))
+
+    assert "watched" not in restored.__dict__
+    assert watched_sets(restored) == expected
+    np.testing.assert_array_equal(
+        restored.item_idf_array, fitted_knn.item_idf_array
+    )
+
+
+def test_neighbour_table(fitted_knn: UserKnn) -> None:
+    n_users = len(fitted_knn.users_inv_array)
+    width = fitted_knn.N_users - 1
+    assert fitted_knn.neighbours.shape == (n_users, width)
+    assert fitted_knn.neighbour_sims.dtype == np.float32
+    for inner in range(n_users):
+        ids, sims = table_neighbours(
+            fitted_knn.neighbours, fitted_knn.neighbour_sims, inner
+        )
+        live_ids, live_sims = similar_users(
+            fitted_knn.user_knn, inner, fitted_knn.N_users
+        )
+        np.testing.assert_array_equal(ids, live_ids)
+        np.testing.assert_allclose(sims, live_sims, rtol=1e-6)
+        assert inner not in ids
+        assert (sims < 1).all()
+
+
+def test_fill_neighbours_matches_neighbour_table(fitted_knn: UserKnn) -> None:
+    ids = np.zeros_like(fitted_knn.neighbours)
+    sims = np.zeros_like(fitted_knn.neighbour_sims)
+    users = np.arange(len(fitted_knn.users_inv_array))
+    fill_neighbours(
+        fitted_knn.user_knn.similarity, ids, sims, users, fitted_knn.N_users
+    )
+    np.testing.assert_allclose(sims, fitted_knn.neighbour_sims)
+    assert (ids >= 0).sum() == (fitted_knn.neighbours >= 0).sum()
+
+
+def test_fit_keeps_mappings_as_lazy_views(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    users = interactions["user_id"].unique()
+    np.testing.assert_array_equal(fitted_knn.users_inv_array, users)
+    matrix = fitted_knn.weights_matrix.tocoo()
+    assert matrix.shape == (len(users), interactions["item_id"].nunique())
+    assert matrix.sum() == len(interactions)
+
+    restored = pickle.loads(pickle.dumps(fitted_knn))
+    assert not set(MAPPING_VIEWS) & set(restored.__dict__)
+    assert restored.users_mapping == {user: i for i, user in enumerate(users)}
+    assert restored.items_inv_mapping == dict(
+        enumerate(fitted_knn.items_inv_array)
+    )
+    np.testing.assert_array_equal(
+        restored.get_matrix(interactions).toarray(), matrix.toarray()
+    )
+
+
+@pytest.mark.parametrize("weighting", ["idf", "bm25", "log_popularity"])
+def test_item_weightings(interactions: pd.DataFrame, weighting: str) -> None:
+    model = UserKnn(CosineRecommender(K=20), weighting=weighting)
+    model.fit(interactions)
+
+    n = len(interactions)
+    doc_freq = interactions["item_id"].value_counts()
+    doc_freq = doc_freq.loc[model.items_inv_array].to_numpy()
+    expected = {
+        "idf": np.log((1 + n) / (1 + doc_freq) + 1),
+        "bm25": np.log((n - doc_freq + 0.5) / (doc_freq + 0.5) + 1),
+        "log_popularity": np.log(1 + doc_freq),
+    }[weighting]
+    np.testing.assert_allclose(model.item_idf_array, expected, rtol=1e-6)
+
+
+def test_unknown_weighting() -> None:
+    with pytest.raises(ValueError):
+        UserKnn(CosineRecommender(), weighting="tf")
+
+
+def sort_recs(recs: pd.DataFrame) -> pd.DataFrame:
+    recs = recs.astype({"score": np.float64})
+    return recs.sort_values(["user_id", "rank"]).reset_index(drop=True)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_predict_chunks_matches_predict(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    n_jobs: int,
+) -> None:
+    expected = sort_recs(fitted_knn.predict(interactions))
+    chunks = list(
+        fitted_knn.predict_chunks(interactions, chunk_size=7, n_jobs=n_jobs)
+    )
+    assert len(chunks) == 9
+    pd.testing.assert_frame_equal(sort_recs(pd.concat(chunks)), expected)
+
+
+def test_predict_to_file(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+    tmp_path: Path,
+) -> None:
+    path = str(tmp_path / "recs.csv")
+    n_rows = fitted_knn.predict_to_file(interactions, path, chunk_size=25)
+    expected = sort_recs(fitted_knn.predict(interactions))
+    assert n_rows == len(expected)
+    pd.testing.assert_frame_equal(sort_recs(pd.read_csv(path)), expected)
+
+
+def assert_same_recs(model: UserKnn, interactions: pd.DataFrame) -> None:
+    n_recs = 10
+    expected = sort_recs(model.predict(interactions, n_recs))
+    recs = sort_recs(model.predict(interactions, n_recs, "sparse"))
+    pd.testing.assert_series_equal(recs["user_id"], expected["user_id"])
+    pd.testing.assert_series_equal(recs["rank"], expected["rank"])
+    np.testing.assert_allclose(recs["score"], expected["score"], rtol=1e-6)
+    # items with equal scores may be ranked in any order,
+    # so only compare items scored above the last rank
+    for (_, got), (_, want) in zip(
+        recs.groupby("user_id"), expected.groupby("user_id")
+    ):
+        above = want["score"].min() + 1e-9
+        assert set(got.loc[got["score"] > above, "item_id"]) == set(
+            want.loc[want["score"] > above, "item_id"]
+        )
+
+
+def test_sparse_scoring_matches_pandas(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    assert_same_recs(fitted_knn, interactions)
+
+
+def test_sparse_scoring_keeps_identical_users(
+    interactions: pd.DataFrame,
+) -> None:
+    # two users with the same history are as similar as can be, the
+    # neighbour table leaves them out but the pandas scoring does not
+    twins = pd.DataFrame(
+        {"user_id": [1, 1, 1, 2, 2, 2], "item_id": [3, 6, 9] * 2}
+    )
+    interactions = pd.concat([interactions, twins], ignore_index=True)
+    model = UserKnn(CosineRecommender(K=20), N_users=10)
+    model.fit(interactions)
+    assert model.users_mapping[2] not in table_neighbours(
+        model.neighbours, model.neighbour_sims, model.users_mapping[1]
+    )[0]
+
+    assert_same_recs(model, interactions)
+
+
+def test_sparse_scoring_without_neighbour_table(
+    interactions: pd.DataFrame,
+    fitted_knn: UserKnn,
+) -> None:
+    expected = sort_recs(fitted_knn.predict(interactions, scoring="sparse"))
+    # models pickled before the table look neighbours up
+    fitted_knn.neighbours = None
+    recs = sort_recs(fitted_knn.predict(interactions, scoring="sparse"))
+    pd.testing.assert_series_equal(recs["user_id"], expected["user_id"])
+    np.testing.assert_allclose(recs["score"], expected["score"], rtol=1e-6)
+
+
+def test_sparse_sum_aggregate(fitted_knn: UserKnn) -> None:
+    user_id = fitted_knn.users_inv_array[0]
+    recs = fitted_knn.predict(
+        pd.DataFrame({"user_id": [user_id]}), 1000, "sparse", "sum"
+    )
+    neighbours, sims = similar_users(
+        fitted_knn.user_knn, 0, fitted_knn.N_users, np.inf
+    )
+    expected = np.zeros(len(fitted_knn.items_inv_array))
+    indptr, indices = fitted_knn.watched_indptr, fitted_knn.watched_indices
+    for neighbour, sim in zip(neighbours, sims):
+        expected[indices[indptr[neighbour]:indptr[neighbour + 1]]] += sim
+    expected *= fitted_knn.item_idf_array
+    scores = pd.Series(
+        recs["score"].to_numpy(),
+        index=pd.Index(fitted_knn.items_inv_array).get_indexer(
+            recs["item_id"]
+        ),
+    )
+    assert len(scores) == np.count_nonzero(expected)
+    np.testing.assert_allclose(scores, expected[scores.index], rtol=1e-6)
+    assert recs["rank"].tolist() == list(range(1, len(recs) + 1))
+
+
+def test_unknown_scoring(fitted_knn: UserKnn) -> None:
+    test = pd.DataFrame({"user_id": fitted_knn.users_inv_array[:1]})
+    with pytest.raises(ValueError):
+        fitted_knn.predict(test, scoring="numba")
+    with pytest.raises(ValueError):
+        fitted_knn.predict(test, aggregate="sum")
+
+
+def split_interactions(interactions: pd.DataFrame):
+    # later rows of existing users and all rows of the last users
+    rng = np.random.default_rng(0)
+    later = (rng.random(len(interactions)) < 0.2) | (
+        interactions["user_id"] >= interactions["user_id"].max() - 50
+    )
+    return interactions[~later], interactions[later]
+
+
+def test_partial_fit_matches_fit(interactions: pd.DataFrame) -> None:
+    first, later = split_interactions(interactions)
+    # K above the number of users, so no similarity row is truncated
+    model = UserKnn(CosineRecommender(K=100), N_users=10)
+    model.fit(first)
+    model.partial_fit(later)
+    full = UserKnn(CosineRecommender(K=100), N_users=10)
+    full.fit(pd.concat([first, later]))
+
+    np.testing.assert_array_equal(model.users_inv_array, full.users_inv_array)
+    np.testing.assert_array_equal(model.items_inv_array, full.items_inv_array)
+    np.testing.assert_array_equal(model.watched_indptr, full.watched_indptr)
+    np.testing.assert_array_equal(model.watched_indices, full.watched_indices)
+    np.testing.assert_allclose(model.item_idf_array, full.item_idf_array)
+    np.testing.assert_allclose(
+        model.user_knn.similarity.toarray(),
+        full.user_knn.similarity.toarray(),
+        atol=1e-6,
+    )
+    assert model.users_mapping == full.users_mapping
+    np.testing.assert_allclose(
+        model.neighbour_sims, full.neighbour_sims, atol=1e-6
+    )
+    recs = sort_recs(model.predict(interactions, scoring="sparse"))
+    expected = sort_recs(full.predict(interactions, scoring="sparse"))
+    np.testing.assert_allclose(recs["score"], expected["score"], rtol=1e-6)
+
+
+def test_partial_fit_truncates_rows(interactions: pd.DataFrame) -> None:
+    first, later = split_interactions(interactions)
+    model = UserKnn(CosineRecommender(K=5), N_users=5)
+    model.fit(first)
+    model.partial_fit(later)
+    full = UserKnn(CosineRecommender(K=5), N_users=5)
+    full.fit(pd.concat([first, later]))
+
+    similarity = model.user_knn.similarity
+    assert similarity.shape == full.user_knn.similarity.shape
+    assert np.diff(similarity.indptr).max() <= 5
+    # users with new interactions are recomputed exactly
+    new_user = full.users_mapping[interactions["user_id"].max()]
+    np.testing.assert_allclose(
+        np.sort(similarity[new_user].data),
+        np.sort(full.user_knn.similarity[new_user].data),
+    )
+    new_users = pd.DataFrame({"user_id": later["user_id"].unique()})
+    assert len(model.predict(new_users)) > 0
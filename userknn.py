@@ -1,29 +1,187 @@
-from collections import Counter
-from typing import Dict
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from typing import Callable, Dict, Iterator, Optional, Tuple, Union
 
 import implicit
 import numpy as np
 import pandas as pd
 import scipy as sp
-from implicit.nearest_neighbours import ItemItemRecommender
+from implicit.nearest_neighbours import (
+    CosineRecommender,
+    ItemItemRecommender,
+    normalize,
+)
+
+from service.api.models.knn_index import (
+    fill_neighbours,
+    gather_rows,
+    neighbour_table,
+    row_ranks,
+    similar_users,
+)
+from service.api.models.lsh_index import LSHIndex
+
+# implicit>=0.5 fits on a user-items matrix and finds similar columns,
+# older versions expect item-users and find similar rows
+IMPLICIT_USER_ITEMS = tuple(
+    int(part) for part in implicit.__version__.split(".")[:2]
+) >= (0, 5)
+
+# dict views of the id arrays, built on first use and never pickled
+MAPPING_VIEWS = (
+    "users_inv_mapping",
+    "users_mapping",
+    "items_inv_mapping",
+    "items_mapping",
+)
+
+
+def idf_weights(n: int, doc_freq: np.ndarray) -> np.ndarray:
+    return np.log((1 + n) / (1 + doc_freq) + 1)
+
+
+def bm25_weights(n: int, doc_freq: np.ndarray) -> np.ndarray:
+    return np.log((n - doc_freq + 0.5) / (doc_freq + 0.5) + 1)
+
+
+def log_popularity_weights(n: int, doc_freq: np.ndarray) -> np.ndarray:
+    # favours popular items, unlike the idf variants
+    return np.log1p(doc_freq)
+
+
+# item weightings by name, functions of the number of interactions
+# and per item interaction counts
+ITEM_WEIGHTINGS: Dict[str, Callable[[int, np.ndarray], np.ndarray]] = {
+    "idf": idf_weights,
+    "bm25": bm25_weights,
+    "log_popularity": log_popularity_weights,
+}
+
+# backends of UserKnn.predict and the ways the sparse one combines
+# neighbours that watched the same item
+SCORINGS = ("pandas", "sparse")
+AGGREGATES = ("max", "sum")
+
+
+# model shared with chunk prediction workers, see UserKnn.predict_chunks
+_worker_model: Optional["UserKnn"] = None
+
+
+def _top_k_entries(
+    rows: np.ndarray,
+    cols: np.ndarray,
+    data: np.ndarray,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Keep the ``k`` largest of the COO entries of every row."""
+    order, ranks = row_ranks(rows, data)
+    order = order[ranks < k]
+    return rows[order], cols[order], data[order]
+
+
+def _top_k_row_entries(
+    matrix: sp.sparse.csr_matrix,
+    k: int,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """COO entries of the ``k`` largest values of every row of ``matrix``."""
+    positions = []
+    for start, end in zip(matrix.indptr[:-1], matrix.indptr[1:]):
+        if end - start > k:
+            top = np.argpartition(-matrix.data[start:end], k - 1)[:k]
+            positions.append(start + top)
+        else:
+            positions.append(np.arange(start, end))
+    positions = np.concatenate([np.empty(0, dtype=np.int64)] + positions)
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    return rows[positions], matrix.indices[positions], matrix.data[positions]
+
+
+def _set_worker_model(model: "UserKnn") -> None:
+    global _worker_model  # pylint: disable=global-statement
+    _worker_model = model
+
+
+def _predict_worker_chunk(
+    users: np.ndarray,
+    N_recs: int,
+    scoring: str,
+    aggregate: str,
+) -> pd.DataFrame:
+    return _worker_model.predict(
+        pd.DataFrame({"user_id": users}), N_recs, scoring, aggregate
+    )
 
 
 class UserKnn:
     """Class for fit-perdict UserKNN model
     based on ItemKNN model from implicit.nearest_neighbours
+
+    ``model`` finds similar users: an exact implicit recommender or an
+    approximate `LSHIndex` for segments too large for it.
     """
 
-    def __init__(self, model: ItemItemRecommender, N_users: int = 50):
+    # models pickled before weightings were added used idf
+    weighting = "idf"
+
+    def __init__(
+        self,
+        model: Union[ItemItemRecommender, LSHIndex],
+        N_users: int = 50,
+        weighting: str = "idf",
+    ):
+        if weighting not in ITEM_WEIGHTINGS:
+            raise ValueError(f"Unknown weighting: {weighting}")
         self.N_users = N_users
         self.model = model
+        self.weighting = weighting
         self.is_fitted = False
 
-    def get_mappings(self, train):
-        self.users_inv_mapping = dict(enumerate(train["user_id"].unique()))
-        self.users_mapping = {v: k for k, v in self.users_inv_mapping.items()}
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in MAPPING_VIEWS:
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # models pickled before the CSR index keep `watched` as a frame
+        if "watched" in state and "watched_indptr" not in state:
+            self._set_watched_from_frame(self.__dict__.pop("watched"))
+        if "item_idf" in state and "item_idf_array" not in state:
+            self._set_item_idf_array()
+
+    @cached_property
+    def users_inv_mapping(self) -> Dict[int, int]:
+        return dict(enumerate(self.users_inv_array))
+
+    @cached_property
+    def users_mapping(self) -> Dict[int, int]:
+        return {v: k for k, v in enumerate(self.users_inv_array)}
+
+    @cached_property
+    def items_inv_mapping(self) -> Dict[int, int]:
+        return dict(enumerate(self.items_inv_array))
 
-        self.items_inv_mapping = dict(enumerate(train["item_id"].unique()))
-        self.items_mapping = {v: k for k, v in self.items_inv_mapping.items()}
+    @cached_property
+    def items_mapping(self) -> Dict[int, int]:
+        return {v: k for k, v in enumerate(self.items_inv_array)}
+
+    def get_mappings(self, train) -> Tuple[np.ndarray, np.ndarray]:
+        """Assign inner ids in order of first appearance.
+
+        Returns int32 inner user and item ids of every row of ``train``.
+        """
+        user_codes, self.users_inv_array = pd.factorize(
+            train["user_id"].to_numpy()
+        )
+        item_codes, self.items_inv_array = pd.factorize(
+            train["item_id"].to_numpy()
+        )
+        for name in MAPPING_VIEWS:
+            self.__dict__.pop(name, None)
+        return user_codes.astype(np.int32), item_codes.astype(np.int32)
 
     def get_matrix(
         self,
@@ -34,54 +192,269 @@ class UserKnn:
         users_mapping: Dict[int, int] = None,
         items_mapping: Dict[int, int] = None,
     ):
+        # ids are looked up in users_inv_array and items_inv_array,
+        # the mapping arguments are only kept for compatibility
+        user_codes = pd.Index(self.users_inv_array).get_indexer(df[user_col])
+        item_codes = pd.Index(self.items_inv_array).get_indexer(df[item_col])
+        weights = df[weight_col] if weight_col else None
+        return self._build_matrix(user_codes, item_codes, weights)
 
-        if weight_col:
-            weights = df[weight_col].astype(np.float32)
-        else:
-            weights = np.ones(len(df), dtype=np.float32)
-
-        interaction_matrix = sp.sparse.coo_matrix(
-            (
-                weights,
-                (
-                    df[user_col].map(self.users_mapping.get),
-                    df[item_col].map(self.items_mapping.get),
-                ),
-            )
+    def _build_matrix(
+        self,
+        user_codes: np.ndarray,
+        item_codes: np.ndarray,
+        weights: np.ndarray = None,
+    ) -> sp.sparse.csr_matrix:
+        if weights is None:
+            weights = np.ones(len(user_codes), dtype=np.float32)
+        interaction_matrix = sp.sparse.csr_matrix(
+            (np.asarray(weights, dtype=np.float32), (user_codes, item_codes)),
+            shape=(len(self.users_inv_array), len(self.items_inv_array)),
         )
-
-        self.watched = df.groupby(user_col).agg({item_col: list})
+        self._set_watched(interaction_matrix)
         return interaction_matrix
 
+    def _set_watched(self, interaction_matrix: sp.sparse.csr_matrix):
+        # user -> watched items index over inner ids:
+        self.watched_indptr = interaction_matrix.indptr.astype(np.int32)
+        self.watched_indices = interaction_matrix.indices.astype(np.int32)
+
+    def _set_watched_from_frame(self, watched: pd.DataFrame):
+        self.users_inv_array = np.array(
+            [self.users_inv_mapping[i] for i in range(len(self.users_mapping))]
+        )
+        self.items_inv_array = np.array(
+            [self.items_inv_mapping[i] for i in range(len(self.items_mapping))]
+        )
+        items = watched["item_id"]
+        users = watched.index.map(self.users_mapping).to_numpy()
+        rows = np.repeat(users, items.str.len().to_numpy())
+        cols = pd.Series(np.concatenate(items.to_numpy())).map(
+            self.items_mapping
+        )
+        watched_matrix = sp.sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(self.users_mapping), len(self.items_mapping)),
+        )
+        self.watched_indptr = watched_matrix.indptr.astype(np.int32)
+        self.watched_indices = watched_matrix.indices.astype(np.int32)
+
     def idf(self, n: int, x: float):
-        return np.log((1 + n) / (1 + x) + 1)
+        return idf_weights(n, x)
+
+    def _count_item_idf(self, item_codes: np.ndarray):
+        """Weigh items by the configured weighting of their counts.
+
+        ``item_codes`` are inner item ids of the train interactions.
+        """
+        doc_freq = np.bincount(item_codes, minlength=len(self.items_inv_array))
+        self._set_item_weights(doc_freq)
 
-    def _count_item_idf(self, df: pd.DataFrame):
-        item_cnt = Counter(df["item_id"].values)
-        item_idf = pd.DataFrame.from_dict(
-            item_cnt, orient="index", columns=["doc_freq"]
-        ).reset_index()
-        item_idf["idf"] = item_idf["doc_freq"].apply(
-            lambda x: self.idf(self.n, x)
+    def _set_item_weights(self, doc_freq: np.ndarray):
+        weights = ITEM_WEIGHTINGS[self.weighting](self.n, doc_freq)
+        self.item_idf_array = weights.astype(np.float32)
+        self.item_idf = pd.DataFrame(
+            {
+                "index": self.items_inv_array,
+                "doc_freq": doc_freq,
+                "idf": weights,
+            }
         )
-        self.item_idf = item_idf
+
+    def _set_item_idf_array(self):
+        # idf aligned to inner item ids, for plain array lookups
+        item_idf_array = np.zeros(len(self.items_inv_array), dtype=np.float32)
+        inner = pd.Index(self.items_inv_array).get_indexer(
+            self.item_idf["index"]
+        )
+        item_idf_array[inner] = self.item_idf["idf"].to_numpy()
+        self.item_idf_array = item_idf_array
 
     def fit(self, train: pd.DataFrame):
         self.user_knn = self.model
-        self.get_mappings(train)
-        self.weights_matrix = self.get_matrix(
-            train,
-            users_mapping=self.users_mapping,
-            items_mapping=self.items_mapping,
-        )
+        user_codes, item_codes = self.get_mappings(train)
+        self.weights_matrix = self._build_matrix(user_codes, item_codes)
 
         self.n = train.shape[0]
-        self._count_item_idf(train)
+        self._count_item_idf(item_codes)
 
         if not self.is_fitted:
-            self.user_knn.fit(self.weights_matrix)
+            self._fit_user_knn()
             self.is_fitted = True
 
+        self.build_neighbours()
+
+    def _fit_user_knn(self):
+        if not isinstance(self.user_knn, ItemItemRecommender):
+            self.user_knn.fit(self.weights_matrix)
+        # users are the "items" of the underlying ItemItemRecommender
+        elif IMPLICIT_USER_ITEMS:
+            self.user_knn.fit(self.weights_matrix.T.tocsr())
+        else:
+            self.user_knn.fit(self.weights_matrix.tocsr())
+
+    def partial_fit(self, train: pd.DataFrame):
+        """Add the ``train`` interactions to a fitted model.
+
+        New users and items get the next inner ids, the interaction
+        matrix, item weights and neighbours are updated in place. Only
+        the similarities of users with new interactions are recomputed;
+        a row of another user is re-truncated to the ``K`` best with the
+        new values, so a neighbour it dropped before is not brought back.
+        Other neighbour models, such as the TF-IDF ones, weigh users by
+        global statistics and are refitted.
+        """
+        if not self.is_fitted:
+            return self.fit(train)
+        if getattr(self, "weights_matrix", None) is None:
+            raise ValueError("Model has no interaction matrix to update")
+
+        user_codes = self._extend_ids("users_inv_array", train["user_id"])
+        item_codes = self._extend_ids("items_inv_array", train["item_id"])
+        for name in MAPPING_VIEWS:
+            self.__dict__.pop(name, None)
+
+        shape = (len(self.users_inv_array), len(self.items_inv_array))
+        new_matrix = sp.sparse.csr_matrix(
+            (
+                np.ones(len(user_codes), dtype=np.float32),
+                (user_codes, item_codes),
+            ),
+            shape=shape,
+        )
+        self.weights_matrix.resize(shape)
+        self.weights_matrix = self.weights_matrix + new_matrix
+        self._set_watched(self.weights_matrix)
+
+        self.n += train.shape[0]
+        doc_freq = np.asarray(self.weights_matrix.sum(axis=0)).ravel()
+        self._set_item_weights(doc_freq.astype(np.int64))
+
+        changed = self._update_similarity(np.unique(user_codes))
+        self._update_neighbours(changed)
+        return self
+
+    def _extend_ids(self, name: str, ids: pd.Series) -> np.ndarray:
+        """Inner ids of ``ids``, unseen ones are appended to ``name``."""
+        known = getattr(self, name)
+        ids = ids.to_numpy()
+        codes = pd.Index(known).get_indexer(ids)
+        unseen = codes < 0
+        new_codes, new_ids = pd.factorize(ids[unseen])
+        codes[unseen] = new_codes + len(known)
+        setattr(self, name, np.concatenate([known, new_ids]))
+        return codes.astype(np.int32)
+
+    def _update_similarity(self, users: np.ndarray) -> np.ndarray:
+        """Recompute the similarities of ``users`` with everyone.
+
+        Returns the inner ids of users whose similarity rows changed.
+        """
+        knn = self.user_knn
+        n_users = len(self.users_inv_array)
+        if type(knn) not in (CosineRecommender, ItemItemRecommender):
+            self._fit_user_knn()
+            return np.arange(n_users)
+
+        vectors = self.weights_matrix
+        if isinstance(knn, CosineRecommender):
+            vectors = normalize(vectors).tocsr()
+        fresh = (vectors[users] @ vectors.T).tocsr()
+        top_rows, top_cols, top_data = _top_k_row_entries(fresh, knn.K)
+        fresh = fresh.tocoo()
+        fresh_rows = users[fresh.row]
+
+        # fresh rows replace the old ones, and their values replace
+        # the old similarities towards ``users`` in every other row
+        affected = np.zeros(n_users, dtype=bool)
+        affected[users] = True
+        old = knn.similarity.tocoo()
+        dropped = ~affected[old.row] & affected[old.col]
+        keep = ~affected[old.row] & ~affected[old.col]
+        rows, cols, data = old.row[keep], old.col[keep], old.data[keep]
+
+        # a fresh value only gets into another row if it beats the
+        # smallest one kept there, or the row has room left
+        counts = np.bincount(rows, minlength=n_users)
+        smallest = np.full(n_users, np.inf)
+        np.minimum.at(smallest, rows, data)
+        mirror = ~affected[fresh.col] & (
+            (counts[fresh.col] < knn.K) | (fresh.data > smallest[fresh.col])
+        )
+        resorted = np.zeros(n_users, dtype=bool)
+        resorted[fresh.col[mirror]] = True
+
+        unchanged = ~resorted[rows]
+        merged = _top_k_entries(
+            np.concatenate([rows[~unchanged], fresh.col[mirror]]),
+            np.concatenate([cols[~unchanged], fresh_rows[mirror]]),
+            np.concatenate([data[~unchanged], fresh.data[mirror]]),
+            knn.K,
+        )
+        knn.similarity = sp.sparse.csr_matrix(
+            (
+                np.concatenate([data[unchanged], top_data, merged[2]]),
+                (
+                    np.concatenate(
+                        [rows[unchanged], users[top_rows], merged[0]]
+                    ),
+                    np.concatenate([cols[unchanged], top_cols, merged[1]]),
+                ),
+            ),
+            shape=(n_users, n_users),
+        )
+        if getattr(knn, "scorer", None) is not None:
+            knn.scorer = type(knn.scorer)(knn.similarity)
+        resorted[users] = True
+        return np.union1d(np.flatnonzero(resorted), old.row[dropped])
+
+    def _update_neighbours(self, users: np.ndarray):
+        if getattr(self, "neighbours", None) is None or not hasattr(
+            self.user_knn, "similarity"
+        ):
+            self.build_neighbours()
+            return
+        n_new = len(self.users_inv_array) - len(self.neighbours)
+        width = self.neighbours.shape[1]
+        self.neighbours = np.vstack(
+            [self.neighbours, np.full((n_new, width), -1, dtype=np.int32)]
+        )
+        self.neighbour_sims = np.vstack(
+            [self.neighbour_sims, np.zeros((n_new, width), dtype=np.float32)]
+        )
+        fill_neighbours(
+            self.user_knn.similarity,
+            self.neighbours,
+            self.neighbour_sims,
+            users,
+            self.N_users,
+        )
+
+    def build_neighbours(self):
+        """Materialise neighbours of every user for serving.
+
+        Ids are inner user ids, the user itself and neighbours with
+        similarity >= 1 are excluded, rows are padded with -1.
+        """
+        n_users = len(self.users_inv_array)
+        if isinstance(self.user_knn, LSHIndex):
+            # the index ranked its candidates while fitting, a lookup
+            # per user would search the buckets again
+            width = max(self.N_users - 1, 0)
+            self.neighbours = np.full((n_users, width), -1, dtype=np.int32)
+            self.neighbour_sims = np.zeros((n_users, width), dtype=np.float32)
+            fill_neighbours(
+                self.user_knn.similarity,
+                self.neighbours,
+                self.neighbour_sims,
+                np.arange(n_users),
+                self.N_users,
+            )
+            return
+        self.neighbours, self.neighbour_sims = neighbour_table(
+            self.user_knn, n_users, self.N_users
+        )
+
     def _generate_recs_mapper(
         self,
         model: ItemItemRecommender,
@@ -91,18 +464,38 @@ class UserKnn:
     ):
         def _recs_mapper(user):
             user_id = user_mapping[user]
-            recs = model.similar_items(user_id, N=N)[1:]
-            # [1:] ~ exclude same user
-            return [user_inv_mapping[user] for user, _ in recs], [
-                sim for _, sim in recs
-            ]
+            # exclude same user
+            users, sims = similar_users(model, user_id, N, max_sim=np.inf)
+            return [user_inv_mapping[user] for user in users], list(sims)
 
         return _recs_mapper
 
-    def predict(self, test: pd.DataFrame, N_recs: int = 10):
+    def predict(
+        self,
+        test: pd.DataFrame,
+        N_recs: int = 10,
+        scoring: str = "pandas",
+        aggregate: str = "max",
+    ):
+        """Top-``N_recs`` items of every test user.
 
+        ``scoring="sparse"`` computes the same scores from the neighbour
+        table with flat arrays instead of exploding a frame of
+        neighbours. An item watched by several neighbours is scored by
+        the most similar of them, or with ``aggregate="sum"`` (sparse
+        only) by the sum of their similarities, a sparse product. A max
+        is no product, so it keeps the first of the sorted neighbours.
+        """
         if not self.is_fitted:
             raise ValueError("Please call fit before predict")
+        if scoring not in SCORINGS:
+            raise ValueError(f"Unknown scoring: {scoring}")
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {aggregate}")
+        if scoring == "sparse":
+            return self._predict_sparse(test, N_recs, aggregate)
+        if aggregate != "max":
+            raise ValueError("pandas scoring only supports aggregate='max'")
 
         mapper = self._generate_recs_mapper(
             model=self.user_knn,
@@ -116,21 +509,20 @@ class UserKnn:
         # * on pd.DataFrame (*df) splits rows into:
         # row1, row2, row3, ..., rown
         recs = recs.set_index("user_id").apply(pd.Series.explode).reset_index()
+        recs = recs.dropna(subset=["sim_user_id"])
 
-        recs = (
-            recs.merge(
-                self.watched,
-                left_on=["sim_user_id"],
-                right_on=["user_id"],
-                how="left",
-            )
-            .explode("item_id")
-            .sort_values(["user_id", "sim"], ascending=False)
-            .drop_duplicates(["user_id", "item_id"], keep="first")
-            .merge(
-                self.item_idf, left_on="item_id", right_on="index", how="left"
-            )
+        # items of similar users, read from the CSR index:
+        owners, items = gather_rows(
+            self.watched_indptr,
+            self.watched_indices,
+            recs["sim_user_id"].map(self.users_mapping).to_numpy(),
         )
+        recs = recs.iloc[owners].reset_index(drop=True)
+        recs["item_id"] = self.items_inv_array[items]
+        recs["idf"] = self.item_idf_array[items]
+
+        recs = recs.sort_values(["user_id", "sim"], ascending=False)
+        recs = recs.drop_duplicates(["user_id", "item_id"], keep="first")
 
         recs["score"] = recs["sim"] * recs["idf"]
         recs = recs.sort_values(["user_id", "score"], ascending=False)
@@ -138,3 +530,220 @@ class UserKnn:
         return recs[recs["rank"] <= N_recs][
             ["user_id", "item_id", "score", "rank"]
         ]
+
+    def _neighbour_matrix(self, users: np.ndarray) -> sp.sparse.csr_matrix:
+        """Test users x train users matrix of neighbour similarities.
+
+        Neighbours are those of the pandas scoring, so that both give
+        the same scores. Full rows of the neighbour table are read at
+        once, with their similarities in double precision from the
+        model. The table leaves out neighbours as similar as the user
+        itself, which makes their rows short, so these rows and models
+        pickled without a table look neighbours up one by one.
+        """
+        inner = pd.Index(self.users_inv_array).get_indexer(users)
+        if (inner < 0).any():
+            raise KeyError(users[inner < 0][0])
+        table = getattr(self, "neighbours", None)
+        if table is None:
+            full = np.zeros(len(inner), dtype=bool)
+            width = 0
+        else:
+            width = table.shape[1]
+            full = (table[inner] >= 0).sum(axis=1) == width
+        looked_up = {
+            row: similar_users(self.user_knn, inner[row], self.N_users, np.inf)
+            for row in np.flatnonzero(~full)
+        }
+        lengths = np.full(len(inner), width, dtype=np.int64)
+        for row, (ids, _) in looked_up.items():
+            lengths[row] = len(ids)
+        indptr = np.concatenate([[0], np.cumsum(lengths)])
+        indices = np.empty(indptr[-1], dtype=np.int64)
+        data = np.empty(indptr[-1], dtype=np.float64)
+
+        full_rows = np.flatnonzero(full)
+        if full_rows.size and width:
+            positions = indptr[full_rows, None] + np.arange(width)
+            owners = inner[full_rows]
+            indices[positions] = table[owners]
+            similarity = getattr(self.user_knn, "similarity", None)
+            if similarity is None:
+                data[positions] = self.neighbour_sims[owners]
+            else:
+                data[positions] = similarity[
+                    np.repeat(owners, width), table[owners].ravel()
+                ].A1.reshape(-1, width)
+        for row, (ids, sims) in looked_up.items():
+            start, end = indptr[row], indptr[row + 1]
+            indices[start:end] = ids
+            data[start:end] = sims
+        return sp.sparse.csr_matrix(
+            (data, indices, indptr),
+            shape=(len(users), len(self.users_inv_array)),
+        )
+
+    def _score_matrix(
+        self,
+        neighbours: sp.sparse.csr_matrix,
+        aggregate: str,
+    ) -> sp.sparse.csr_matrix:
+        n_items = len(self.items_inv_array)
+        if aggregate == "sum":
+            watched = sp.sparse.csr_matrix(
+                (
+                    np.ones(len(self.watched_indices), dtype=np.float32),
+                    self.watched_indices,
+                    self.watched_indptr,
+                ),
+                shape=(len(self.users_inv_array), n_items),
+            )
+            scores = (neighbours @ watched).tocsr()
+        else:
+            # neighbours are sorted by similarity, so the first time an
+            # item shows up in a row it comes from the most similar one
+            rows = np.repeat(
+                np.arange(neighbours.shape[0]), np.diff(neighbours.indptr)
+            )
+            owners, items = gather_rows(
+                self.watched_indptr, self.watched_indices, neighbours.indices
+            )
+            keys = rows[owners].astype(np.int64) * n_items + items
+            _, first = np.unique(keys, return_index=True)
+            scores = sp.sparse.csr_matrix(
+                (
+                    neighbours.data[owners[first]],
+                    (rows[owners[first]], items[first]),
+                ),
+                shape=(neighbours.shape[0], n_items),
+            )
+        scores.data *= self.item_idf_array[scores.indices]
+        return scores
+
+    def _predict_sparse(
+        self,
+        test: pd.DataFrame,
+        N_recs: int,
+        aggregate: str,
+    ) -> pd.DataFrame:
+        # users in the order the pandas scoring sorts them
+        users = np.sort(test["user_id"].unique())[::-1]
+        scores = self._score_matrix(self._neighbour_matrix(users), aggregate)
+
+        # row-wise top-N: order entries by row, then by score
+        rows = np.repeat(np.arange(len(users)), np.diff(scores.indptr))
+        order = np.lexsort((-scores.data, rows))
+        rank = np.arange(len(order)) - scores.indptr[rows[order]] + 1
+        top = order[rank <= N_recs]
+        return pd.DataFrame(
+            {
+                "user_id": users[rows[top]],
+                "item_id": self.items_inv_array[scores.indices[top]],
+                "score": scores.data[top].astype(np.float64),
+                "rank": rank[rank <= N_recs],
+            }
+        )
+
+    def predict_chunks(
+        self,
+        test: pd.DataFrame,
+        N_recs: int = 10,
+        chunk_size: int = 100_000,
+        n_jobs: int = 1,
+        scoring: str = "pandas",
+        aggregate: str = "max",
+    ) -> Iterator[pd.DataFrame]:
+        """Run `predict` over chunks of ``chunk_size`` test users.
+
+        Yields the top-``N_recs`` of every chunk in order, so memory is
+        bounded by the chunk size rather than by the number of users.
+        With ``n_jobs`` > 1 chunks are predicted in worker processes,
+        forked where possible so that the model is not copied to them.
+        """
+        users = test["user_id"].unique()
+        chunks = (
+            users[start:start + chunk_size]
+            for start in range(0, len(users), chunk_size)
+        )
+        if n_jobs <= 1:
+            for chunk in chunks:
+                yield self.predict(
+                    pd.DataFrame({"user_id": chunk}),
+                    N_recs,
+                    scoring,
+                    aggregate,
+                )
+            return
+
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "fork" if "fork" in methods else None
+        )
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=context,
+            initializer=_set_worker_model,
+            initargs=(self,),
+        ) as pool:
+            # a couple of chunks per worker keep them busy
+            # while finished ones are consumed
+            pending: deque = deque()
+            for chunk in chunks:
+                if len(pending) >= 2 * n_jobs:
+                    yield pending.popleft().result()
+                pending.append(
+                    pool.submit(
+                        _predict_worker_chunk,
+                        chunk,
+                        N_recs,
+                        scoring,
+                        aggregate,
+                    )
+                )
+            while pending:
+                yield pending.popleft().result()
+
+    def predict_to_file(
+        self,
+        test: pd.DataFrame,
+        path: str,
+        N_recs: int = 10,
+        chunk_size: int = 100_000,
+        n_jobs: int = 1,
+        scoring: str = "pandas",
+        aggregate: str = "max",
+    ) -> int:
+        """Stream `predict_chunks` to a ``.csv`` or ``.parquet`` file.
+
+        Parquet needs pyarrow. Returns the number of rows written.
+        """
+        parquet = path.endswith(".parquet")
+        if parquet:
+            # pylint: disable=import-outside-toplevel
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+        writer = None
+        n_rows = 0
+        try:
+            for recs in self.predict_chunks(
+                test, N_recs, chunk_size, n_jobs, scoring, aggregate
+            ):
+                recs = recs.astype({"score": np.float64})
+                if parquet:
+                    table = pa.Table.from_pandas(recs, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(path, table.schema)
+                    writer.write_table(table)
+                else:
+                    recs.to_csv(
+                        path,
+                        mode="a" if n_rows else "w",
+                        header=not n_rows,
+                        index=False,
+                    )
+                n_rows += len(recs)
+        finally:
+            if writer is not None:
+                writer.close()
+        return n_rows